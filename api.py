@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+
+from flask import Blueprint, Response, request, session, jsonify
+
+from models import db, Location, Review, User, Favorite, format_discount, average_rating
+from pagination import keyset_page, page_size_from
+from listing import location_listing, listing_cache_key
+from cache import cache, location_tag
+from recommendations import similar_query
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Версионированный JSON API только для чтения. Ответы собираются из кортежей
+# колонок без загрузки объектов Location и помечаются строгим ETag — хешем
+# тела ответа: повторный запрос с If-None-Match получает 304 без тела. Тело
+# обычно берётся из кэша, а запись отзывов и голосов не трогает общих счётчиков.
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+REVIEWS_PER_PAGE = 20
+SIMILAR_LIMIT = 3
+MIN_COMPRESS_BYTES = 512
+ENCODING_SUFFIXES = ('', '-gzip', '-br')
+
+LOCATION_COLUMNS = (
+    Location.id, Location.name, Location.address, Location.category, Location.category_id,
+    Location.discount_value, Location.discount_min, Location.discount_max,
+    Location.latitude, Location.longitude, Location.reviews_count, Location.rating_sum, Location.validity_score,
+)
+DETAIL_COLUMNS = LOCATION_COLUMNS + (Location.description, Location.valid_votes, Location.invalid_votes)
+REVIEW_COLUMNS = (Review.id, Review.rating, Review.text, Review.created_at, User.username)
+
+
+def location_row_to_dict(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'address': row.address,
+        'category': row.category or '',
+        'category_id': row.category_id,
+        'discount': format_discount(row.discount_min, row.discount_max, row.discount_value),
+        'discount_min': row.discount_min,
+        'discount_max': row.discount_max,
+        'lat': row.latitude,
+        'lon': row.longitude,
+        'rating': average_rating(row.rating_sum, row.reviews_count),
+        'reviews_count': row.reviews_count or 0,
+        'validity': row.validity_score,
+    }
+
+
+def review_row_to_dict(row):
+    return {
+        'id': row.id,
+        'rating': row.rating,
+        'text': row.text,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'author': row.username,
+    }
+
+
+def _error(message, status):
+    return jsonify({'error': message}), status
+
+
+def _etag(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# Сжатый ответ несёт ETag с суффиксом кодировки, поэтому принимаются все варианты
+def _matched_etag(etag):
+    if_none_match = request.if_none_match
+    for suffix in ENCODING_SUFFIXES:
+        if if_none_match.contains(etag + suffix):
+            return etag + suffix
+    return None
+
+
+def _conditional(build, private=False):
+    payload = build()
+    if payload is None:
+        return _error('Место не найдено', 404)
+    response = jsonify(payload)
+    etag = _etag(response.get_data())
+    matched = _matched_etag(etag)
+    if matched is not None:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    return response
+
+
+def _cached_payload(key, build, tags=None):
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        if payload is not None:
+            cache.set(key, payload, tags=tags(payload) if tags else ())
+    return payload
+
+
+@api_v1.after_request
+def compress_response(response):
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=5)
+    else:
+        data = gzip.compress(data, compresslevel=6)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{'br' if encoding == 'br' else 'gzip'}", weak)
+    return response
+
+
+@api_v1.route('/locations')
+def locations():
+    def build():
+        rows, next_cursor, total, total_exact = location_listing(request.args, columns=LOCATION_COLUMNS)
+        return {
+            'items': [location_row_to_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'approx_total': total,
+            'total_is_exact': total_exact,
+        }
+
+    return _conditional(lambda: _cached_payload(
+        listing_cache_key('api_v1_locations', request.args), build,
+        tags=lambda payload: [location_tag(item['id']) for item in payload['items']],
+    ))
+
+
+@api_v1.route('/locations/<int:location_id>')
+def location_detail(location_id):
+    def build():
+        row = db.session.query(*DETAIL_COLUMNS).filter(Location.id == location_id, Location.listed()).first()
+        if row is None:
+            return None
+        similar = similar_query(location_id, *LOCATION_COLUMNS, limit=SIMILAR_LIMIT).all()
+        item = location_row_to_dict(row)
+        item.update(description=row.description, valid_votes=row.valid_votes, invalid_votes=row.invalid_votes)
+        return {'item': item, 'similar': [location_row_to_dict(similar_row) for similar_row in similar]}
+
+    return _conditional(lambda: _cached_payload(
+        cache.page_key('api_v1_location', location_id=location_id), build,
+        tags=lambda payload: [location_tag(location_id)],
+    ))
+
+
+@api_v1.route('/locations/<int:location_id>/reviews')
+def location_reviews(location_id):
+    def build():
+        rows, next_cursor = keyset_page(
+            db.session.query(*REVIEW_COLUMNS).join(User, User.id == Review.user_id)
+            .filter(Review.location_id == location_id),
+            [(Review.created_at, True), (Review.id, True)],
+            request.args.get('after'),
+            page_size_from(request.args.get('per_page'), REVIEWS_PER_PAGE),
+        )
+        if not rows and db.session.query(Location.id).filter(Location.id == location_id,
+                                                             Location.listed()).scalar() is None:
+            return None
+        return {'items': [review_row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    return _conditional(lambda: _cached_payload(
+        cache.page_key('api_v1_reviews', location_id=location_id,
+                       after=request.args.get('after', ''), per_page=request.args.get('per_page', '')),
+        build, tags=lambda payload: [location_tag(location_id)],
+    ))
+
+
+@api_v1.route('/favorites')
+def favorites():
+    user_id = session.get('user_id')
+    if user_id is None:
+        return _error('Необходимо войти в систему', 401)
+
+    def build():
+        rows, next_cursor = keyset_page(
+            db.session.query(*LOCATION_COLUMNS, Favorite.id.label('favorite_id'))
+            .join(Favorite, Favorite.location_id == Location.id)
+            .filter(Favorite.user_id == user_id, Location.listed()),
+            [(Favorite.id, True)],
+            request.args.get('after'),
+            page_size_from(request.args.get('per_page')),
+            cursor_key=lambda row: [row.favorite_id],
+        )
+        return {'items': [location_row_to_dict(row) for row in rows], 'next_cursor': next_cursor}
+
+    return _conditional(build, private=True)
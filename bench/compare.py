@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+
+# Сравнение двух файлов результатов bench.run или bench.scenarios:
+#   python -m bench.compare bench/results/before.json bench/results/after.json --threshold 10
+# Код выхода 1, если хотя бы один замер стал медленнее порога.
+
+# Для этих метрик больше — лучше
+HIGHER_IS_BETTER = {'rps', 'items_per_s'}
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        payload = json.load(f)
+    return payload.get('meta', {}), {result['name']: result for result in payload['results']}
+
+
+def compare(before, after, metric='median', threshold=10.0):
+    rows = []
+    regressions = []
+    for name in sorted(before.keys() | after.keys()):
+        old = before.get(name, {}).get(metric)
+        new = after.get(name, {}).get(metric)
+        if old is None or new is None or not old:
+            rows.append((name, old, new, None))
+            continue
+        change = (new - old) / old * 100
+        rows.append((name, old, new, change))
+        slower = -change if metric in HIGHER_IS_BETTER else change
+        if slower > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def _format(value, metric):
+    if value is None:
+        return '—'
+    if metric in HIGHER_IS_BETTER:
+        return f'{value:.1f}'
+    return f'{value * 1000:.3f} мс'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение результатов бенчмарков')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--metric', default='median', help='median, min, mean, p90, p99, rps, items_per_s')
+    parser.add_argument('--threshold', type=float, default=10.0, help='допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    before_meta, before = load(args.before)
+    after_meta, after = load(args.after)
+    print(f"{before_meta.get('revision') or args.before} → {after_meta.get('revision') or args.after}, "
+          f"метрика {args.metric}, порог {args.threshold:g}%")
+    rows, regressions = compare(before, after, args.metric, args.threshold)
+    for name, old, new, change in rows:
+        mark = '  ✗' if name in regressions else ''
+        change_text = f'{change:+.1f}%' if change is not None else ''
+        print(f"{name:<50} {_format(old, args.metric):>14} {_format(new, args.metric):>14} {change_text:>9}{mark}")
+
+    if regressions:
+        print(f"✗ Ухудшения сверх {args.threshold:g}%: {len(regressions)}")
+        sys.exit(1)
+    print("✓ Ухудшений сверх порога нет")
@@ -0,0 +1,170 @@
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+# Синтетическая выгрузка в формате data.json: кодировка cp1251, те же
+# синонимы ключей и geoData, что в настоящих файлах. Часть записей
+# специально не проходит фильтр (не Москва, чужая категория, дубли).
+#
+#   python -m bench.generate --rows 10k bench/data/data-10k.json
+#   python -m bench.generate --rows 1k --activity  # + пользователи, отзывы, голоса в DATABASE_URL
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+CATEGORIES = [
+    ('Аптека', ['Ригла', 'Горздрав', 'Столички', 'Неофарм', 'Аптека 36,6']),
+    ('Магазин продовольственных товаров', ['Пятёрочка', 'Дикси', 'Перекрёсток', 'Магнолия', 'ВкусВилл']),
+    ('Предприятия услуг', ['Химчистка «Диана»', 'Ремонт обуви', 'Фотоателье', 'Копицентр']),
+    ('Общественное питание', ['Му-Му', 'Теремок', 'Грабли', 'Шоколадница']),
+    ('Кафе', ['Кофе Хауз', 'Даблби', 'Кафе «Юность»']),
+    ('Столовая', ['Столовая № 57', 'Столовая «Ложка»']),
+    ('Бытовые услуги', ['Парикмахерская', 'Ателье', 'Ремонт часов']),
+    ('Книги', ['Читай-город', 'Республика', 'Московский Дом книги']),
+    ('Одежда и обувь', ['Глория Джинс', 'Спортмастер', 'Обувь «Ральф»']),
+    ('Ювелирный салон', ['Санлайт']),  # не входит в ALLOWED_CATEGORIES
+]
+
+STREETS = [
+    'Тверская улица', 'улица Арбат', 'Ленинский проспект', 'Профсоюзная улица', 'Садовая-Кудринская улица',
+    'проспект Мира', 'Варшавское шоссе', 'улица Покровка', 'Кутузовский проспект', 'улица Вавилова',
+    'Каширское шоссе', 'Дмитровское шоссе', 'улица Бутырская', 'Щёлковское шоссе', 'Рязанский проспект',
+]
+
+# Центры районов: точки на карте сгущаются вокруг них, как в настоящих данных
+DISTRICTS = [
+    (55.7558, 37.6173), (55.7963, 37.5376), (55.6521, 37.6014), (55.8304, 37.6310),
+    (55.7095, 37.7929), (55.7400, 37.4100), (55.6100, 37.7300), (55.8800, 37.5400),
+]
+
+NAME_KEYS = ('Name', 'CommonName')
+ADDRESS_KEYS = ('Address', 'AddressString')
+CATEGORY_KEYS = ('Category', 'ObjectCategory')
+DESCRIPTION_KEYS = ('Description', 'Note')
+MIN_KEYS = ('Минимальный размер скидки, %', 'MinDiscountSize', 'MinDiscount', 'discount_min')
+MAX_KEYS = ('Максимальный размер скидки, %', 'MaxDiscountSize', 'MaxDiscount', 'discount_max')
+FREE_TEXT_DISCOUNTS = ('Скидка {a}% по социальной карте', 'от {a} до {b}%', '{a}-{b}%', '{a} %', 'По социальной карте')
+
+
+def _discount(item, rng):
+    a = rng.choice([3, 5, 7, 10, 15])
+    b = a + rng.choice([0, 5, 10, 15])
+    kind = rng.random()
+    if kind < 0.4:
+        item[rng.choice(MIN_KEYS)] = a
+        item[rng.choice(MAX_KEYS)] = b if rng.random() < 0.7 else f'{b},0 %'
+    elif kind < 0.55:
+        item[rng.choice(MAX_KEYS)] = b
+    elif kind < 0.9:
+        item[rng.choice(('Discount', 'DiscountSize'))] = rng.choice(FREE_TEXT_DISCOUNTS).format(a=a, b=b)
+
+
+def generate_items(rows, seed=1):
+    rng = random.Random(seed)
+    items = []
+    for i in range(rows):
+        category, brands = rng.choice(CATEGORIES)
+        lat, lon = rng.choice(DISTRICTS)
+        item = {
+            'global_id': 100000 + i,
+            rng.choice(NAME_KEYS): f'{rng.choice(brands)} №{i}',
+            rng.choice(ADDRESS_KEYS): f'город Москва, {rng.choice(STREETS)}, дом {rng.randint(1, 250)}, строение {i % 7 + 1}',
+            rng.choice(CATEGORY_KEYS): category,
+        }
+        if rng.random() < 0.95:
+            item['geoData'] = {'type': 'Point', 'coordinates': [round(rng.gauss(lon, 0.05), 6), round(rng.gauss(lat, 0.03), 6)]}
+        if rng.random() < 0.3:
+            item[rng.choice(DESCRIPTION_KEYS)] = 'Скидка предоставляется при предъявлении социальной карты студента'
+        _discount(item, rng)
+
+        roll = rng.random()
+        if roll < 0.04:
+            item.pop('Address', None)
+            item['AddressString'] = 'Московская область, г. Химки, ул. Ленина, д. 1'
+        elif roll < 0.06 and items:
+            # Дубль по названию и адресу с другим global_id
+            duplicate = dict(rng.choice(items))
+            duplicate['global_id'] = 100000 + i
+            item = duplicate
+        items.append(item)
+    return items
+
+
+def write_data_file(path, rows, seed=1):
+    with open(path, 'w', encoding='cp1251', errors='replace') as f:
+        json.dump(generate_items(rows, seed), f, ensure_ascii=False)
+    return path
+
+
+# Пользователи, отзывы, голоса и избранное для уже загруженных мест
+def seed_activity(users=200, reviews=2000, votes=2000, favorites=1000, seed=1):
+    from werkzeug.security import generate_password_hash
+    from models import db, User, Location, Review, DiscountVote, Favorite, reconcile_location_stats
+    from scoring import score_locations
+
+    rng = random.Random(seed)
+    location_ids = [location_id for (location_id,) in db.session.query(Location.id).filter(Location.listed())]
+    if not location_ids:
+        raise RuntimeError('Сначала загрузите места: python data_loader.py <файл>')
+
+    # Хэш пароля дорогой, у всех синтетических пользователей он один: пароль bench
+    password = generate_password_hash('bench')
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'bench{first_user + n}', 'email': f'bench{first_user + n}@example.com', 'password': password}
+        for n in range(users)
+    ])
+    user_ids = list(range(first_user, first_user + users))
+
+    now = datetime.utcnow()
+    db.session.execute(Review.__table__.insert(), [
+        {'user_id': rng.choice(user_ids), 'location_id': rng.choice(location_ids),
+         'text': rng.choice(['Всё отлично, скидку дали', 'Скидку не дали', 'Нормально', 'Долго искали кассира']),
+         'rating': rng.randint(1, 5), 'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))}
+        for _ in range(reviews)
+    ])
+
+    # Голос и избранное уникальны для пары пользователь–место
+    vote_pairs = {(rng.choice(user_ids), rng.choice(location_ids)) for _ in range(votes)}
+    if vote_pairs:
+        db.session.execute(DiscountVote.__table__.insert(), [
+            {'user_id': user_id, 'location_id': location_id, 'is_valid': rng.random() < 0.8,
+             'updated_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))}
+            for user_id, location_id in vote_pairs
+        ])
+    favorite_pairs = {(rng.choice(user_ids), rng.choice(location_ids)) for _ in range(favorites)}
+    if favorite_pairs:
+        db.session.execute(Favorite.__table__.insert(), [
+            {'user_id': user_id, 'location_id': location_id} for user_id, location_id in favorite_pairs
+        ])
+    db.session.commit()
+    reconcile_location_stats()
+    score_locations(full=True)
+    return {'users': users, 'reviews': reviews, 'votes': len(vote_pairs), 'favorites': len(favorite_pairs)}
+
+
+def _rows(value):
+    return SIZES.get(value) or int(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Синтетическая выгрузка мест со скидками')
+    parser.add_argument('output', nargs='?', help='куда записать data.json')
+    parser.add_argument('--rows', type=_rows, default=SIZES['1k'], help='1k, 10k, 100k или число')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--activity', action='store_true',
+                        help='добавить пользователей, отзывы и голоса в базу из DATABASE_URL')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--reviews', type=int, default=2000)
+    parser.add_argument('--votes', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.output:
+        write_data_file(args.output, args.rows, args.seed)
+        print(f"✓ {args.output}: {args.rows} записей")
+    if args.activity:
+        from app import create_app
+
+        with create_app().app_context():
+            created = seed_activity(args.users, args.reviews, args.votes, seed=args.seed)
+        print(f"✓ Добавлено: {created}")
@@ -0,0 +1,25 @@
+import random
+
+from locust import HttpUser, between
+
+from bench.scenarios import SCENARIOS
+
+# Те же сценарии и веса, что в bench/scenarios.py, для locust (в requirements не входит):
+#   pip install locust
+#   locust -f bench/locustfile.py --host http://127.0.0.1:5001 --headless -u 50 -r 10 -t 60s --json
+
+
+def _make_task(name, make_path):
+    def visit(user):
+        user.client.get(make_path(user.rng, user.location_ids), name=name)
+    return visit
+
+
+class Visitor(HttpUser):
+    wait_time = between(0.5, 2)
+    tasks = {_make_task(name, make_path): weight for name, weight, make_path in SCENARIOS}
+
+    def on_start(self):
+        self.rng = random.Random()
+        payload = self.client.get('/api/v1/locations?per_page=100', name='api/v1/locations').json()
+        self.location_ids = [item['id'] for item in payload['items']] or [1]
@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from bench.generate import SIZES, generate_items, write_data_file
+
+# Микробенчмарки чистых функций и замеры импорта на временной SQLite без
+# зависимостей, кроме requirements. Те же замеры на pytest-benchmark — в
+# tests/test_benchmarks.py. Результат — JSON в bench/results/, два файла
+# сравнивает bench.compare.
+#
+#   python -m bench.run                    # 1k и 10k
+#   python -m bench.run --sizes 1k,10k,100k --output bench/results/before.json
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def measure(name, func, rounds=5, number=1, items=None, setup=None):
+    timings = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    result = {
+        'name': name,
+        'unit': 's',
+        'rounds': rounds,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+    if items:
+        result['items'] = items
+        result['items_per_s'] = items / result['median'] if result['median'] else None
+    print(f"{name:<45} {result['median'] * 1000:>10.3f} мс" +
+          (f"  {result['items_per_s']:>10.0f} записей/с" if items else ''))
+    return result
+
+
+def helper_benchmarks():
+    from models import Location, format_discount, average_rating
+    from normalize import normalize_item, parse_discount_text, content_hash
+    from search import stem, terms_for
+    from geo import cell_for
+
+    items = generate_items(1000, seed=7)
+    rows = [row for row in map(normalize_item, items) if row]
+    location = Location(name='Аптека', address='Москва', discount_min=5, discount_max=15, reviews_count=3, rating_sum=11)
+    words = [word for row in rows for word in (row['name'] + ' ' + row['address']).lower().split()]
+
+    def stem_cold():
+        stem.cache_clear()
+        for word in words:
+            stem(word)
+
+    return [
+        measure('helpers: normalize_item x1000', lambda: [normalize_item(item) for item in items], number=3,
+                items=len(items)),
+        measure('helpers: content_hash x1000', lambda: [content_hash(row) for row in rows], number=3, items=len(rows)),
+        measure('helpers: parse_discount_text x1000',
+                lambda: [parse_discount_text('от 5 до 15% по социальной карте') for _ in range(1000)], number=3),
+        measure('helpers: format_discount x10000', lambda: [format_discount(5.0, 15.0, None) for _ in range(10000)],
+                number=3),
+        measure('helpers: average_rating x10000', lambda: [average_rating(11, 3) for _ in range(10000)], number=3),
+        measure('helpers: Location.get_discount_display x10000',
+                lambda: [location.get_discount_display() for _ in range(10000)], number=3),
+        measure('helpers: stem со сброшенным кэшем', stem_cold, items=len(words)),
+        measure('helpers: terms_for x1000', lambda: [terms_for(row['name'], row['address']) for row in rows],
+                number=3, items=len(rows)),
+        measure('helpers: cell_for x10000', lambda: [cell_for(55.75, 37.61) for _ in range(10000)], number=3),
+    ]
+
+
+def _quiet(func):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+    return run
+
+
+def import_benchmarks(sizes, workdir, rounds):
+    from app import create_app
+    from models import db
+    from migrations import upgrade
+    from data_loader import load_data_from_json, sync_data_from_json
+    from json_stream import open_source, iter_json_array
+
+    results = []
+    for label in sizes:
+        rows = SIZES[label]
+        path = write_data_file(os.path.join(workdir, f'data-{label}.json'), rows)
+        db_path = os.path.join(workdir, f'bench-{label}.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+        app = create_app()
+
+        def fresh_database():
+            with app.app_context():
+                db.engine.dispose()
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+                upgrade()
+
+        def parse_only():
+            with open_source(path) as f:
+                for _ in iter_json_array(f):
+                    pass
+
+        with app.app_context():
+            results.append(measure(f'import: разбор JSON {label}', parse_only, rounds=rounds, items=rows))
+            results.append(measure(f'import: load_data_from_json {label}', _quiet(lambda: load_data_from_json(path)),
+                                   rounds=rounds, items=rows, setup=fresh_database))
+            results.append(measure(f'import: sync без изменений {label}',
+                                   _quiet(lambda: sync_data_from_json(path, force=True)), rounds=rounds, items=rows))
+            results.append(measure(f'import: sync с проверкой отпечатка {label}',
+                                   _quiet(lambda: sync_data_from_json(path)), rounds=rounds))
+        with app.app_context():
+            db.engine.dispose()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**extra):
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        **extra,
+    }
+
+
+def save_results(payload, output=None, prefix='bench'):
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{prefix}-{stamp}-{payload['meta']['revision'] or 'local'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"✓ Результаты записаны в {output}")
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Бенчмарки импорта и вспомогательных функций')
+    parser.add_argument('--sizes', default='1k,10k', help='через запятую: 1k, 10k, 100k')
+    parser.add_argument('--rounds', type=int, default=3, help='повторов замера импорта')
+    parser.add_argument('--skip-import', action='store_true')
+    parser.add_argument('--output', help='файл результатов, по умолчанию bench/results/bench-<время>-<коммит>.json')
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"неизвестные размеры: {', '.join(unknown)}")
+
+    # Импорт и приложение работают с временной SQLite, рабочая база не трогается
+    workdir = tempfile.mkdtemp(prefix='discounts-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    results = helper_benchmarks()
+    if not args.skip_import:
+        results.extend(import_benchmarks(sizes, workdir, args.rounds))
+    save_results({'meta': metadata(kind='bench', sizes=sizes), 'results': results}, args.output)
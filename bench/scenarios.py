@@ -0,0 +1,198 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from bench.generate import SIZES, write_data_file
+from bench.run import metadata, save_results
+
+# Нагрузочные сценарии для основных маршрутов. Два режима:
+#   python -m bench.scenarios --url http://127.0.0.1:5001 --duration 30 --concurrency 8
+#       — против запущенного сервера (gunicorn -c gunicorn.conf.py wsgi:app с SECRET_KEY=... и DATABASE_URL=sqlite:///...);
+#   python -m bench.scenarios --prepare 10k --duration 10
+#       — в одном процессе через тестовый клиент Flask на временной SQLite с синтетическими данными.
+# Для locust те же сценарии описаны в bench/locustfile.py.
+
+MOSCOW_BBOX = (55.55, 37.35, 55.92, 37.85)
+
+
+def _random_point(rng):
+    south, west, north, east = MOSCOW_BBOX
+    return rng.uniform(south, north), rng.uniform(west, east)
+
+
+def _map_bbox(rng, zoom):
+    lat, lon = _random_point(rng)
+    half = 0.6 / 2 ** (zoom - 10)
+    return f'{lat - half / 2:.5f},{lon - half:.5f},{lat + half / 2:.5f},{lon + half:.5f}'
+
+
+# (имя, вес, функция пути). Веса примерно повторяют долю страниц в логах
+SCENARIOS = [
+    ('index', 20, lambda rng, ids: '/'),
+    ('index: категория', 10, lambda rng, ids: f'/?category={rng.randint(1, 11)}'),
+    ('index: поиск', 10, lambda rng, ids: '/?search=' + rng.choice(['аптека', 'кафе', 'тверская', 'пятёрочка', 'ригла'])),
+    ('index: сортировка по скидке', 5, lambda rng, ids: '/?sort=discount&discount_from=10'),
+    ('location_detail', 25, lambda rng, ids: f'/location/{rng.choice(ids)}'),
+    ('map', 3, lambda rng, ids: '/map'),
+    ('api/map/clusters', 10, lambda rng, ids: (
+        lambda zoom: f'/api/map/clusters?zoom={zoom}&bbox={_map_bbox(rng, zoom)}')(rng.randint(10, 16))),
+    ('api/locations/nearby', 5, lambda rng, ids: '/api/locations/nearby?lat={:.5f}&lon={:.5f}&radius=1'.format(
+        *_random_point(rng))),
+    ('api/v1/locations', 7, lambda rng, ids: '/api/v1/locations?per_page=50'),
+    ('api/v1/locations/<id>', 5, lambda rng, ids: f'/api/v1/locations/{rng.choice(ids)}'),
+]
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.base_url + path, timeout=30) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def get(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.get(path).status_code
+
+    def get_json(self, path):
+        return self.app.test_client().get(path).get_json()
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenarios(client, location_ids, duration, concurrency, seed=1):
+    names = [name for name, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    paths = {name: make_path for name, _, make_path in SCENARIOS}
+    timings = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = client.get(paths[name](rng, location_ids))
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings[name].append(elapsed)
+                if status is None or status >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    results = []
+    for name in names:
+        values = timings[name]
+        if not values:
+            continue
+        result = {
+            'name': f'http: {name}',
+            'unit': 's',
+            'requests': len(values),
+            'errors': errors[name],
+            'rps': len(values) / wall,
+            'median': statistics.median(values),
+            'p90': _percentile(values, 0.9),
+            'p99': _percentile(values, 0.99),
+            'max': max(values),
+        }
+        results.append(result)
+        print(f"{name:<30} {len(values):>7} запр. {result['rps']:>8.1f}/с  p50 {result['median'] * 1000:>7.1f} мс  "
+              f"p90 {result['p90'] * 1000:>7.1f} мс  p99 {result['p99'] * 1000:>7.1f} мс  ошибок {errors[name]}")
+    total = sum(len(values) for values in timings.values())
+    print(f"{'всего':<30} {total:>7} запр. {total / wall:>8.1f}/с")
+    return results
+
+
+def prepare_app(label, workdir):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, f'scenarios-{label}.db')}"
+    from app import create_app
+    from migrations import upgrade
+    from data_loader import load_data_from_json
+    from bench.generate import seed_activity
+
+    app = create_app()
+    path = write_data_file(os.path.join(workdir, f'data-{label}.json'), SIZES[label])
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        upgrade()
+        load_data_from_json(path)
+        seed_activity()
+    return app
+
+
+# id мест берутся из API, чтобы режим --url не требовал доступа к базе
+def location_ids_from(client, limit=1000):
+    ids = []
+    path = '/api/v1/locations?per_page=100'
+    while path and len(ids) < limit:
+        payload = client.get_json(path)
+        ids.extend(item['id'] for item in payload['items'])
+        cursor = payload.get('next_cursor')
+        path = f'/api/v1/locations?per_page=100&after={cursor}' if cursor else None
+    return ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочные сценарии для основных маршрутов')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='адрес запущенного сервера')
+    target.add_argument('--prepare', choices=sorted(SIZES), help='поднять приложение на временной SQLite')
+    parser.add_argument('--duration', type=float, default=10, help='секунд на прогон')
+    parser.add_argument('--concurrency', type=int, default=4, help='параллельных клиентов')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл результатов, по умолчанию bench/results/scenarios-<время>-<коммит>.json')
+    args = parser.parse_args()
+
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        client = FlaskClient(prepare_app(args.prepare, tempfile.mkdtemp(prefix='discounts-scenarios-')))
+    ids = location_ids_from(client)
+    if not ids:
+        parser.error('не удалось получить id мест из /api/v1/locations')
+
+    results = run_scenarios(client, ids, args.duration, args.concurrency, args.seed)
+    save_results({'meta': metadata(kind='scenarios', target=args.url or f'in-process {args.prepare}',
+                                   duration=args.duration, concurrency=args.concurrency),
+                  'results': results}, args.output, prefix='scenarios')
@@ -0,0 +1,205 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from models import get_meta, bump_meta
+
+DATA_VERSION_KEY = 'data_version'
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    def __init__(self, url, prefix='sds:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('Для CACHE_BACKEND=redis установите пакет redis')
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl, tags=()):
+        pipe = self._redis.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+            pipe.expire(self.prefix + 'tag:' + tag, ttl)
+        pipe.execute()
+
+    def invalidate_tag(self, tag):
+        tag_key = self.prefix + 'tag:' + tag
+        keys = self._redis.smembers(tag_key)
+        pipe = self._redis.pipeline()
+        for key in keys:
+            pipe.delete(self.prefix + key.decode('utf-8'))
+        pipe.delete(tag_key)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self._redis.scan_iter(self.prefix + '*'))
+        if keys:
+            self._redis.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl, tags=()):
+        pass
+
+    def invalidate_tag(self, tag):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
+
+
+def location_tag(location_id):
+    return f'location:{location_id}'
+
+
+# Кэш ответов для анонимных пользователей. Ключи включают версию данных
+# из app_meta: после импорта data_loader увеличивает её, и старые записи
+# перестают находиться во всех процессах сразу.
+class ResponseCache:
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = 60
+        self.version_check_interval = 5
+        self.hits = 0
+        self.misses = 0
+        self._versions = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'memory')
+        if kind == 'memory':
+            self.backend = MemoryBackend(int(app.config.get('CACHE_MAX_ENTRIES', 1000)))
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        else:
+            self.backend = NullBackend()
+        self.ttl = int(app.config.get('CACHE_TTL', 60))
+        self.version_check_interval = float(app.config.get('CACHE_VERSION_CHECK', 5))
+        app.extensions['response_cache'] = self
+
+    def _version(self, key):
+        now = time.monotonic()
+        cached = self._versions.get(key)
+        if cached is None or now - cached[1] > self.version_check_interval:
+            cached = self._versions[key] = (get_meta(key), now)
+        return cached[0]
+
+    def _bump(self, key):
+        value = bump_meta(key)
+        self._versions[key] = (value, time.monotonic())
+        return value
+
+    def data_version(self):
+        return self._version(DATA_VERSION_KEY)
+
+    def page_key(self, route, **parts):
+        values = '|'.join(f'{name}={parts[name] or ""}' for name in sorted(parts))
+        return f'v{self.data_version()}:{route}:{values}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, tags=()):
+        self.backend.set(key, value, self.ttl, tags)
+
+    def evict_location(self, location_id):
+        self.backend.invalidate_tag(location_tag(location_id))
+
+    def evict_locations(self, location_ids):
+        for location_id in location_ids:
+            self.backend.invalidate_tag(location_tag(location_id))
+
+    def bump_data_version(self):
+        version = self._bump(DATA_VERSION_KEY)
+        self.backend.clear()
+        return version
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0,
+            'entries': self.backend.size(),
+            'data_version': self._versions.get(DATA_VERSION_KEY, (None,))[0],
+        }
+
+
+cache = ResponseCache()
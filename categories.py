@@ -0,0 +1,113 @@
+from sqlalchemy.orm import selectinload
+
+from models import db, Location, Category, CategoryFacet
+from normalize import ALLOWED_CATEGORIES, canonical_category
+
+# Диапазоны скидки для фасетов, границы см. в _band_expression
+DISCOUNT_BANDS = (
+    ('none', 'Без процента'),
+    ('lt10', 'до 10%'),
+    ('10_20', '10–20%'),
+    ('20_30', '20–30%'),
+    ('30plus', 'от 30%'),
+)
+
+
+def _band_expression():
+    value = db.func.coalesce(Location.discount_max, Location.discount_min)
+    return db.case(
+        (value.is_(None), 'none'),
+        (value < 10, 'lt10'),
+        (value < 20, '10_20'),
+        (value < 30, '20_30'),
+        else_='30plus',
+    )
+
+
+def category_ids():
+    ids = dict(db.session.query(Category.name, Category.id))
+    missing = [name for name in ALLOWED_CATEGORIES if name not in ids]
+    if missing:
+        db.session.execute(Category.__table__.insert(), [{'name': name, 'locations_count': 0} for name in missing])
+        db.session.commit()
+        ids = dict(db.session.query(Category.name, Category.id))
+    return ids
+
+
+def resolve_category(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    name = canonical_category(value) or value
+    return db.session.query(Category.id).filter(Category.name == name).scalar()
+
+
+def refresh_facets(ids=None):
+    if ids is None:
+        ids = list(category_ids().values())
+    ids = [category_id for category_id in set(ids) if category_id is not None]
+    if not ids:
+        return 0
+
+    band = _band_expression()
+    rows = (db.session.query(Location.category_id, band, db.func.count(Location.id))
+            .filter(Location.category_id.in_(ids), Location.visible())
+            .group_by(Location.category_id, band)
+            .all())
+
+    totals = dict.fromkeys(ids, 0)
+    facets = []
+    for category_id, band_key, count in rows:
+        totals[category_id] += count
+        facets.append({'category_id': category_id, 'band': band_key, 'count': count})
+
+    db.session.query(CategoryFacet).filter(CategoryFacet.category_id.in_(ids)).delete(synchronize_session=False)
+    if facets:
+        db.session.execute(CategoryFacet.__table__.insert(), facets)
+    for category_id, total in totals.items():
+        db.session.query(Category).filter_by(id=category_id).update(
+            {Category.locations_count: total}, synchronize_session=False
+        )
+    db.session.commit()
+    return len(ids)
+
+
+def backfill_category_ids():
+    ids = category_ids()
+    raw_values = [value for (value,) in
+                  db.session.query(Location.category).filter(Location.category_id.is_(None)).distinct()]
+    for raw in raw_values:
+        canonical = canonical_category(raw)
+        if canonical is None:
+            continue
+        db.session.query(Location).filter(Location.category == raw, Location.category_id.is_(None)).update(
+            {Location.category_id: ids[canonical]}, synchronize_session=False
+        )
+    db.session.commit()
+    return refresh_facets()
+
+
+def category_choices():
+    return (Category.query.filter(Category.locations_count > 0)
+            .order_by(Category.name).all())
+
+
+def facets_payload():
+    labels = dict(DISCOUNT_BANDS)
+    order = {key: position for position, (key, _) in enumerate(DISCOUNT_BANDS)}
+    categories = (Category.query.options(selectinload(Category.facets))
+                  .filter(Category.locations_count > 0).order_by(Category.name).all())
+    return [
+        {
+            'id': category.id,
+            'name': category.name,
+            'count': category.locations_count,
+            'discount_bands': [
+                {'band': facet.band, 'label': labels.get(facet.band, facet.band), 'count': facet.count}
+                for facet in sorted(category.facets, key=lambda facet: order.get(facet.band, len(order)))
+            ],
+        }
+        for category in categories
+    ]
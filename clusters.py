@@ -0,0 +1,123 @@
+import math
+
+from models import db, Location, MapCluster
+import geo
+
+# Кластеры считаются заранее для каждого масштаба Яндекс.Карт: точки
+# группируются по квадратам CLUSTER_PX x CLUSTER_PX пикселей в проекции Меркатора
+MIN_CLUSTER_ZOOM = 3
+MAX_CLUSTER_ZOOM = 15
+CLUSTER_PX = 60
+TILE_SIZE = 256
+MAX_POINTS = 1000
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def _world_px(lat, lon, zoom):
+    size = TILE_SIZE * 2 ** zoom
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    phi = math.radians(lat)
+    x = (lon + 180) / 360 * size
+    y = (1 - math.log(math.tan(phi) + 1 / math.cos(phi)) / math.pi) / 2 * size
+    return x, y
+
+
+def cell_at(lat, lon, zoom):
+    x, y = _world_px(lat, lon, zoom)
+    return int(x // CLUSTER_PX), int(y // CLUSTER_PX)
+
+
+def rebuild_clusters(batch_size=5000):
+    cells = {zoom: {} for zoom in range(MIN_CLUSTER_ZOOM, MAX_CLUSTER_ZOOM + 1)}
+    last_id = 0
+    while True:
+        rows = (db.session.query(Location.id, Location.latitude, Location.longitude)
+                .filter(Location.id > last_id, Location.latitude.isnot(None), Location.longitude.isnot(None),
+                        Location.visible())
+                .order_by(Location.id).limit(batch_size).all())
+        if not rows:
+            break
+        for location_id, lat, lon in rows:
+            for zoom, zoom_cells in cells.items():
+                key = cell_at(lat, lon, zoom)
+                cell = zoom_cells.get(key)
+                if cell is None:
+                    zoom_cells[key] = [1, lat, lon, location_id]
+                else:
+                    cell[0] += 1
+                    cell[1] += lat
+                    cell[2] += lon
+        last_id = rows[-1][0]
+
+    db.session.query(MapCluster).delete(synchronize_session=False)
+    created = 0
+    for zoom, zoom_cells in cells.items():
+        batch = [
+            {
+                'zoom': zoom,
+                'cell_x': cell_x,
+                'cell_y': cell_y,
+                'count': count,
+                'latitude': lat_sum / count,
+                'longitude': lon_sum / count,
+                'location_id': location_id if count == 1 else None,
+            }
+            for (cell_x, cell_y), (count, lat_sum, lon_sum, location_id) in zoom_cells.items()
+        ]
+        for start in range(0, len(batch), batch_size):
+            db.session.execute(MapCluster.__table__.insert(), batch[start:start + batch_size])
+        created += len(batch)
+    db.session.commit()
+    return created
+
+
+def total_points():
+    return db.session.query(db.func.coalesce(db.func.sum(MapCluster.count), 0)).filter(
+        MapCluster.zoom == MIN_CLUSTER_ZOOM
+    ).scalar()
+
+
+def point_to_dict(location_id, name, address, category, discount, lat, lon):
+    return {
+        'type': 'point',
+        'id': location_id,
+        'name': name,
+        'address': address,
+        'discount': discount or '',
+        'category': category or '',
+        'lat': lat,
+        'lon': lon,
+    }
+
+
+def clusters_in_bbox(south, west, north, east, zoom):
+    if zoom > MAX_CLUSTER_ZOOM:
+        return [
+            point_to_dict(loc.id, loc.name, loc.address, loc.category, loc.get_discount_display(),
+                          loc.latitude, loc.longitude)
+            for loc in geo.within_bbox(south, west, north, east, limit=MAX_POINTS)
+        ]
+
+    zoom = max(zoom, MIN_CLUSTER_ZOOM)
+    min_x, min_y = cell_at(north, west, zoom)
+    max_x, max_y = cell_at(south, east, zoom)
+    rows = (db.session.query(MapCluster, Location)
+            .outerjoin(Location, Location.id == MapCluster.location_id)
+            .filter(MapCluster.zoom == zoom,
+                    MapCluster.cell_x.between(min_x, max_x),
+                    MapCluster.cell_y.between(min_y, max_y))
+            .all())
+
+    items = []
+    for cluster, location in rows:
+        if location is not None:
+            items.append(point_to_dict(location.id, location.name, location.address, location.category,
+                                       location.get_discount_display(), location.latitude, location.longitude))
+        else:
+            items.append({
+                'type': 'cluster',
+                'count': cluster.count,
+                'lat': cluster.latitude,
+                'lon': cluster.longitude,
+            })
+    return items
@@ -0,0 +1,58 @@
+import os
+
+# Настройки читаются из окружения при создании приложения. Для нагрузочных
+# тестов без MySQL достаточно DATABASE_URL=sqlite:///discounts.db.
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_flag(name, default=''):
+    return os.environ.get(name, default) == '1'
+
+
+# Соединение нужно каждому потоку gunicorn (WEB_THREADS) и потоку отложенной записи.
+# На хост приходится до workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) соединений:
+# по умолчанию (2 * ядра + 1) * (4 + 1 + 2), на 8 ядрах 17 * 7 = 119 при
+# max_connections MySQL 151 по умолчанию. Больше воркеров или хостов — уменьшите
+# WEB_CONCURRENCY или поднимите max_connections.
+def engine_options(uri):
+    # Пул настраивается только для сетевых баз: у SQLite свой пул без этих параметров
+    if uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', _env_int('WEB_THREADS', 4) + 1),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 2),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        # MySQL закрывает простаивающие соединения через wait_timeout
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 280),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', '1'),
+    }
+
+
+class Config:
+    def __init__(self):
+        self.SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
+        self.SQLALCHEMY_DATABASE_URI = os.environ.get(
+            'DATABASE_URL', 'mysql+pymysql://root:@localhost:3306/student_discounts'
+        )
+        self.SQLALCHEMY_ENGINE_OPTIONS = engine_options(self.SQLALCHEMY_DATABASE_URI)
+        self.SQLALCHEMY_TRACK_MODIFICATIONS = False
+        self.YANDEX_MAPS_API_KEY = os.environ.get('YANDEX_MAPS_API_KEY', '')
+        # memory, redis или null. Кэш memory у каждого процесса свой: отзыв, голос или
+        # разбор очереди записи сбрасывают страницы места только в своём процессе, другие
+        # воркеры gunicorn отдают старые страницы до CACHE_TTL. Импорт и пересчёты
+        # увеличивают общий data_version и сбрасывают кэш везде. При нескольких воркерах
+        # нужен redis, иначе gunicorn.conf.py предупреждает при запуске.
+        self.CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+        self.CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        self.CACHE_TTL = _env_int('CACHE_TTL', 60)
+        self.CACHE_MAX_ENTRIES = _env_int('CACHE_MAX_ENTRIES', 1000)
+        self.AUTO_MIGRATE = _env_flag('AUTO_MIGRATE')
+        self.WRITE_BEHIND = _env_flag('WRITE_BEHIND')
+        self.WRITE_QUEUE_PATH = os.environ.get('WRITE_QUEUE_PATH', '')
+        self.SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+        self.SERVER_TIMING = _env_flag('SERVER_TIMING')
+        # Доля занятых соединений, при которой /readyz отвечает 503
+        self.READY_POOL_SATURATION = float(os.environ.get('READY_POOL_SATURATION', 0.9))
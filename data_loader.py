@@ -1,205 +1,252 @@
-import json
+import argparse
+import hashlib
 import sys
 import os
-from app import app
-from models import db, Location
+import time
+from datetime import datetime
+from sqlalchemy import insert, update
+from app import create_app
+from models import db, Location, SyncCheckpoint
+from search import index_locations, remove_from_index
+from clusters import rebuild_clusters
+from recommendations import rebuild_similar
+from json_stream import open_source, iter_json_array, MAX_BUFFER_BYTES
+from normalize import normalized_batches
+from cache import cache
+from migrations import upgrade
+from categories import category_ids, refresh_facets
 
-def migrate_database():
+BATCH_SIZE = 1000
+
+def _existing_keys():
+    query = db.session.query(Location.name, Location.address).execution_options(yield_per=BATCH_SIZE)
+    return set((name, address) for name, address in query)
+
+def _with_category_id(row, ids):
+    row['category_id'] = ids[row.pop('canonical_category')]
+    return row
+
+def _insert_batch(rows):
+    db.session.execute(insert(Location), rows)
+    db.session.commit()
+
+def load_data_from_json(json_file_path, batch_size=BATCH_SIZE, max_buffer_bytes=MAX_BUFFER_BYTES, workers=1):
     try:
-        from sqlalchemy import inspect, text
-        
-        inspector = inspect(db.engine)
-        columns = [col['name'] for col in inspector.get_columns('locations')]
-        
-        added_columns = False
-        
-        if 'discount_min' not in columns:
-            print("Добавляю столбец discount_min...")
-            with db.engine.begin() as conn:
-                conn.execute(text("ALTER TABLE locations ADD COLUMN discount_min FLOAT NULL"))
-            print("✓ Столбец discount_min добавлен")
-            added_columns = True
+        started = time.perf_counter()
         
-        if 'discount_max' not in columns:
-            print("Добавляю столбец discount_max...")
-            with db.engine.begin() as conn:
-                conn.execute(text("ALTER TABLE locations ADD COLUMN discount_max FLOAT NULL"))
-            print("✓ Столбец discount_max добавлен")
-            added_columns = True
+        total_count = 0
+        added_count = 0
+        skipped_count = 0
+        existing = _existing_keys()
+        last_id_before = db.session.query(db.func.coalesce(db.func.max(Location.id), 0)).scalar()
+        ids = category_ids()
+        touched_categories = set()
+
+        with open_source(json_file_path) as f:
+            items = iter_json_array(f, max_buffer=max_buffer_bytes)
+            for rows in normalized_batches(items, batch_size, workers):
+                total_count += len(rows)
+                batch = []
+                for row in rows:
+                    if row is None or (row['name'], row['address']) in existing:
+                        skipped_count += 1
+                        continue
+
+                    existing.add((row['name'], row['address']))
+                    batch.append(_with_category_id(row, ids))
+                    touched_categories.add(row['category_id'])
+
+                if batch:
+                    _insert_batch(batch)
+                    added_count += len(batch)
+
+        print(f"Найдено записей в файле: {total_count}")
+
+        new_ids = [location_id for (location_id,) in
+                   db.session.query(Location.id).filter(Location.id > last_id_before)]
+        index_locations(new_ids)
+        refresh_facets(touched_categories)
+        rebuild_clusters()
+        rebuild_similar()
+        cache.bump_data_version()
+
+        elapsed = time.perf_counter() - started
+        print(f"✓ Успешно добавлено записей: {added_count}")
+        print(f"✓ Пропущено записей (не подошли под фильтр): {skipped_count}")
+        print(f"✓ Время загрузки: {elapsed:.1f} с ({total_count / max(elapsed, 1e-9):.0f} записей/с)")
         
-        if added_columns:
-            print("✓ Миграция базы данных завершена\n")
-        else:
-            print("✓ Столбцы discount_min и discount_max уже существуют\n")
     except Exception as e:
-        print(f"⚠ Ошибка при миграции: {e}")
-        print("\nДобавьте столбцы вручную через phpMyAdmin (SQL вкладка):\n")
-        print("ALTER TABLE locations ADD COLUMN discount_min FLOAT NULL;")
-        print("ALTER TABLE locations ADD COLUMN discount_max FLOAT NULL;\n")
-        raise
+        print(f"Ошибка при загрузке данных: {e}")
+        db.session.rollback()
+
+def _file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _sync_key(source_id, name, address):
+    if source_id:
+        return ('global_id', source_id)
+    return ('name_address', name, address)
 
-def load_data_from_json(json_file_path):
+def _load_sync_index():
+    by_key = {}
+    by_name_address = {}
+    query = db.session.query(
+        Location.id, Location.source_id, Location.name, Location.address, Location.content_hash, Location.deleted_at,
+        Location.category_id
+    ).execution_options(yield_per=BATCH_SIZE)
+    for location_id, source_id, name, address, hash_value, deleted_at, category_id in query:
+        entry = (location_id, hash_value, deleted_at is not None, category_id)
+        by_key[_sync_key(source_id, name, address)] = entry
+        by_name_address[(name, address)] = entry
+    return by_key, by_name_address
+
+def _apply_sync_batch(inserts, updates):
+    if inserts:
+        db.session.execute(insert(Location), inserts)
+    if updates:
+        db.session.execute(update(Location), updates)
+    db.session.commit()
+
+def sync_data_from_json(json_file_path, batch_size=BATCH_SIZE, max_buffer_bytes=MAX_BUFFER_BYTES, force=False,
+                        workers=1):
     try:
-        with open(json_file_path, 'r', encoding='cp1251') as f:
-            data = json.load(f)
-        
-        print(f"Найдено записей в файле: {len(data)}")
-        
-        added_count = 0
+        started = time.perf_counter()
+        source = os.path.basename(json_file_path)
+        fingerprint = _file_fingerprint(json_file_path)
+
+        last = (SyncCheckpoint.query.filter(SyncCheckpoint.source == source, SyncCheckpoint.finished_at.isnot(None))
+                .order_by(SyncCheckpoint.id.desc()).first())
+        if last and last.fingerprint == fingerprint and not force:
+            print(f"✓ Файл {source} не изменился с {last.finished_at:%d.%m.%Y %H:%M}, синхронизация не нужна")
+            return
+
+        checkpoint = SyncCheckpoint(source=source, fingerprint=fingerprint)
+        db.session.add(checkpoint)
+        db.session.commit()
+
+        by_key, by_name_address = _load_sync_index()
+        last_id_before = db.session.query(db.func.coalesce(db.func.max(Location.id), 0)).scalar()
+        seen_ids = set()
+        seen_keys = set()
+        # Как в load_data_from_json: дубль по названию и адресу с другим global_id не вставляется
+        inserted_pairs = set()
+        changed_ids = []
         skipped_count = 0
-        
-        allowed_categories = {
-            'Аптека',
-            'Магазин',
-            'Продовольственные',
-            'Предприятия услуг',
-            'Общественное питание',
-            'Кафе',
-            'Столовая',
-            'Бытовые услуги',
-            'Книги',
-            'Одежда',
-            'Обувь'
-        }
-
-        for item in data:
-            name = (item.get('Name') or item.get('CommonName') or '').strip()
-            address = (item.get('Address') or item.get('AddressString') or '').strip()
-            category = (item.get('Category') or item.get('ObjectCategory') or '').strip()
-            
-            discount = (item.get('Discount') or item.get('DiscountSize') or 'По социальной карте').strip()
-            description = (item.get('Description') or item.get('Note') or '').strip()
-            
-            discount_min = None
-            discount_max = None
-            
-            min_keys = [
-                'Минимальный размер скидки, %',
-                'Минимальный размер скидки',
-                'MinDiscountSize',
-                'MinDiscount',
-                'DiscountMin',
-                'discount_min',
-                'MinimumDiscount'
-            ]
-            
-            max_keys = [
-                'Максимальный размер скидки, %',
-                'Максимальный размер скидки',
-                'MaxDiscountSize',
-                'MaxDiscount',
-                'DiscountMax',
-                'discount_max',
-                'MaximumDiscount'
-            ]
-            
-            for key in min_keys:
-                if key in item and item[key] is not None:
-                    try:
-                        value = item[key]
-                        if isinstance(value, str):
-                            value = value.replace('%', '').replace(',', '.').strip()
-                        discount_min = float(value)
-                        break
-                    except (ValueError, TypeError):
+        ids = category_ids()
+        touched_categories = set()
+
+        with open_source(json_file_path) as f:
+            items = iter_json_array(f, max_buffer=max_buffer_bytes)
+            for rows in normalized_batches(items, batch_size, workers):
+                inserts = []
+                updates = []
+                for row in rows:
+                    checkpoint.seen_count += 1
+                    if row is None:
+                        skipped_count += 1
                         continue
-            
-            for key in max_keys:
-                if key in item and item[key] is not None:
-                    try:
-                        value = item[key]
-                        if isinstance(value, str):
-                            value = value.replace('%', '').replace(',', '.').strip()
-                        discount_max = float(value)
-                        break
-                    except (ValueError, TypeError):
+
+                    key = _sync_key(row['source_id'], row['name'], row['address'])
+                    if key in seen_keys:
+                        skipped_count += 1
                         continue
+                    seen_keys.add(key)
 
-            if not name or not address:
-                skipped_count += 1
-                continue
-
-            if 'москв' not in address.lower():
-                skipped_count += 1
-                continue
-
-            if discount_min is None and discount_max is None and not discount:
-                skipped_count += 1
-                continue
-
-            if allowed_categories:
-                if not any(cat.lower() in category.lower() for cat in allowed_categories):
-                    skipped_count += 1
-                    continue
-
-            existing = Location.query.filter_by(
-                name=name,
-                address=address
-            ).first()
-            if existing:
-                skipped_count += 1
-                continue
-            latitude = None
-            longitude = None
-            if 'geoData' in item and item['geoData']:
-                try:
-                    geo = item['geoData']
-                    if isinstance(geo, dict) and 'coordinates' in geo:
-                        longitude = float(geo['coordinates'][0])
-                        latitude = float(geo['coordinates'][1])
-                except:
-                    pass
-
-            if discount_min is not None or discount_max is not None:
-                if discount_min is not None and discount_max is not None:
-                    if discount_min == discount_max:
-                        discount_value = f"{int(discount_min)}%"
-                    else:
-                        discount_value = f"{int(discount_min)}-{int(discount_max)}%"
-                elif discount_min is not None:
-                    discount_value = f"{int(discount_min)}%"
-                elif discount_max is not None:
-                    discount_value = f"{int(discount_max)}%"
-            else:
-                discount_value = discount 
-            
-            location = Location(
-                name=name,
-                address=address,
-                category=category,
-                discount_value=discount_value,
-                discount_min=discount_min,
-                discount_max=discount_max,
-                latitude=latitude,
-                longitude=longitude,
-                description=description
-            )
-
-            db.session.add(location)
-            added_count += 1
-
-            if added_count % 100 == 0:
-                db.session.commit()
-        
+                    entry = by_key.get(key)
+                    if entry is None and row['source_id']:
+                        # запись, загруженная раньше без global_id
+                        entry = by_name_address.get((row['name'], row['address']))
+                    _with_category_id(row, ids)
+                    if entry is None:
+                        if (row['name'], row['address']) in inserted_pairs:
+                            skipped_count += 1
+                            continue
+                        inserted_pairs.add((row['name'], row['address']))
+                        inserts.append(row)
+                        touched_categories.add(row['category_id'])
+                        continue
+
+                    location_id, hash_value, deleted, category_id = entry
+                    if location_id in seen_ids:
+                        skipped_count += 1
+                        continue
+                    seen_ids.add(location_id)
+                    if hash_value != row['content_hash'] or deleted:
+                        updates.append(dict(row, id=location_id, deleted_at=None))
+                        changed_ids.append(location_id)
+                        touched_categories.update((category_id, row['category_id']))
+
+                _apply_sync_batch(inserts, updates)
+                checkpoint.inserted_count += len(inserts)
+                checkpoint.updated_count += len(updates)
+
+        gone = [
+            (location_id, category_id) for location_id, _, deleted, category_id in by_key.values()
+            if not deleted and location_id not in seen_ids
+        ]
+        gone_ids = [location_id for location_id, _ in gone]
+        touched_categories.update(category_id for _, category_id in gone)
+        now = datetime.utcnow()
+        for start in range(0, len(gone_ids), batch_size):
+            _apply_sync_batch([], [{'id': location_id, 'deleted_at': now} for location_id in gone_ids[start:start + batch_size]])
+        checkpoint.deleted_count = len(gone_ids)
+
+        new_ids = [location_id for (location_id,) in
+                   db.session.query(Location.id).filter(Location.id > last_id_before)]
+        index_locations(new_ids + changed_ids)
+        remove_from_index(gone_ids)
+        refresh_facets(touched_categories)
+        if new_ids or changed_ids or gone_ids:
+            rebuild_clusters()
+            rebuild_similar()
+            cache.bump_data_version()
+
+        checkpoint.finished_at = datetime.utcnow()
         db.session.commit()
-        print(f"✓ Успешно добавлено записей: {added_count}")
+
+        elapsed = time.perf_counter() - started
+        print(f"Найдено записей в файле: {checkpoint.seen_count}")
+        print(f"✓ Добавлено: {checkpoint.inserted_count}, обновлено: {checkpoint.updated_count}, "
+              f"помечено удалёнными: {checkpoint.deleted_count}")
         print(f"✓ Пропущено записей (не подошли под фильтр): {skipped_count}")
-        
+        print(f"✓ Время синхронизации: {elapsed:.1f} с ({checkpoint.seen_count / max(elapsed, 1e-9):.0f} записей/с)")
+
     except Exception as e:
-        print(f"Ошибка при загрузке данных: {e}")
+        print(f"Ошибка при синхронизации данных: {e}")
         db.session.rollback()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Загрузка скидок из открытых данных')
+    parser.add_argument('json_file', nargs='?', default='data.json')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-buffer-mb', type=int, default=MAX_BUFFER_BYTES // (1024 * 1024),
+                        help='максимальный размер одной записи JSON в памяти')
+    parser.add_argument('--sync', action='store_true',
+                        help='обновить изменившиеся записи и пометить пропавшие удалёнными')
+    parser.add_argument('--force', action='store_true', help='синхронизировать, даже если файл не изменился')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='процессов для разбора записей, 0 — по числу ядер')
+    args = parser.parse_args()
+
+    app = create_app()
     with app.app_context():
-        # Создаем таблицы, если их нет
-        db.create_all()
-        
-        # Выполняем миграцию для добавления новых столбцов
-        migrate_database()
+        # Создаем таблицы и применяем миграции схемы
+        upgrade()
         
-        json_file = 'data.json'
+        json_file = args.json_file
         if os.path.exists(json_file):
             print(f"Начинаю загрузку из {json_file}...")
-            load_data_from_json(json_file)
+            max_buffer_bytes = args.max_buffer_mb * 1024 * 1024
+            workers = args.workers or os.cpu_count() or 1
+            if args.sync:
+                sync_data_from_json(json_file, batch_size=args.batch_size,
+                                    max_buffer_bytes=max_buffer_bytes, force=args.force, workers=workers)
+            else:
+                load_data_from_json(json_file, batch_size=args.batch_size,
+                                    max_buffer_bytes=max_buffer_bytes, workers=workers)
         else:
-            print(f"Файл {json_file} не найден в папке проекта!")
\ No newline at end of file
+            print(f"Файл {json_file} не найден в папке проекта!")
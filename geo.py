@@ -0,0 +1,120 @@
+import math
+
+from sqlalchemy import event, or_, and_
+
+from models import db, Location
+# Сетка geo_cell описана в helpers.py, чтобы разбор выгрузки не импортировал ORM
+from helpers import CELL_DEG, LON_CELLS, cell_for
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+MAX_BBOX_ROWS = 200
+
+MAX_RADIUS_KM = 50
+# Во сколько раз больше мест, чем нужно, отбирается по плоскому расстоянию перед точным гаверсинусом
+CANDIDATE_FACTOR = 2
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def bbox_condition(south, west, north, east):
+    exact = and_(Location.latitude.between(south, north), Location.longitude.between(west, east))
+    first_row = int(math.floor((south + 90) / CELL_DEG))
+    last_row = int(math.floor((north + 90) / CELL_DEG))
+    if last_row - first_row >= MAX_BBOX_ROWS or west > east:
+        return exact
+
+    first_col = int(math.floor((west + 180) / CELL_DEG))
+    last_col = int(math.floor((east + 180) / CELL_DEG))
+    ranges = [
+        Location.geo_cell.between(row * LON_CELLS + first_col, row * LON_CELLS + last_col)
+        for row in range(first_row, last_row + 1)
+    ]
+    return and_(or_(*ranges), exact)
+
+
+def within_bbox(south, west, north, east, limit=None):
+    query = Location.query.filter(bbox_condition(south, west, north, east), Location.visible())
+    if limit:
+        query = query.order_by(Location.id).limit(limit)
+    return query.all()
+
+
+# Ранжирование идёт по (id, широта, долгота) без загрузки объектов: база сортирует bbox
+# по плоскому расстоянию и отдаёт не больше limit * CANDIDATE_FACTOR строк
+def _nearest_ids(lat, lon, radius_km, limit):
+    lon_scale = max(math.cos(math.radians(lat)), 0.01)
+    planar = ((Location.latitude - lat) * (Location.latitude - lat)
+              + (Location.longitude - lon) * (Location.longitude - lon) * (lon_scale * lon_scale))
+    rows = (db.session.query(Location.id, Location.latitude, Location.longitude)
+            .filter(bbox_condition(*bbox_around(lat, lon, radius_km)), Location.visible())
+            .order_by(planar, Location.id).limit(limit * CANDIDATE_FACTOR))
+    found = []
+    for location_id, location_lat, location_lon in rows:
+        distance = haversine_km(lat, lon, location_lat, location_lon)
+        if distance <= radius_km:
+            found.append((distance, location_id))
+    found.sort()
+    return found[:limit]
+
+
+def _with_locations(found):
+    by_id = {location.id: location for location in
+             Location.query.filter(Location.id.in_([location_id for _, location_id in found]))} if found else {}
+    return [(distance, by_id[location_id]) for distance, location_id in found if location_id in by_id]
+
+
+def within_radius(lat, lon, radius_km, limit):
+    return _with_locations(_nearest_ids(lat, lon, radius_km, limit))
+
+
+def nearest(lat, lon, k, max_radius_km=MAX_RADIUS_KM):
+    # Радиус растёт без загрузки объектов, сами места читаются один раз в конце
+    radius = 0.5
+    while True:
+        found = _nearest_ids(lat, lon, radius, k)
+        if len(found) >= k or radius >= max_radius_km:
+            return _with_locations(found)
+        radius = min(radius * 2, max_radius_km)
+
+
+# Только места без ячейки, поэтому повторный запуск ничего не пересчитывает
+def backfill_geo_cells(batch_size=1000):
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (db.session.query(Location.id, Location.latitude, Location.longitude)
+                .filter(Location.id > last_id, Location.geo_cell.is_(None),
+                        Location.latitude.isnot(None), Location.longitude.isnot(None))
+                .order_by(Location.id).limit(batch_size).all())
+        if not rows:
+            break
+        db.session.execute(
+            Location.__table__.update()
+            .where(Location.__table__.c.id == db.bindparam('location_id'))
+            .values(geo_cell=db.bindparam('cell')),
+            [{'location_id': location_id, 'cell': cell_for(lat, lon)} for location_id, lat, lon in rows],
+        )
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
+
+
+@event.listens_for(Location, 'before_insert')
+@event.listens_for(Location, 'before_update')
+def _set_geo_cell(mapper, connection, location):
+    location.geo_cell = cell_for(location.latitude, location.longitude)
@@ -0,0 +1,35 @@
+import multiprocessing
+import os
+
+# SECRET_KEY=... gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Каждый воркер держит свой пул соединений: workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# должно укладываться в max_connections MySQL. По умолчанию DB_POOL_SIZE = threads + 1
+# (поток отложенной записи), DB_MAX_OVERFLOW = 2, расчёт на хост — в config.py.
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров ограничивает рост памяти; jitter разводит перезапуски по времени
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+# Приложение создаётся в каждом воркере после fork, поэтому пул соединений,
+# кэш в памяти и поток отложенной записи не делятся между процессами
+preload_app = False
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    if workers > 1 and os.environ.get('CACHE_BACKEND', 'memory') == 'memory':
+        server.log.warning('CACHE_BACKEND=memory при %d воркерах: страницы мест сбрасываются только '
+                           'в процессе, принявшем изменение, остальные отдают их до CACHE_TTL. '
+                           'Используйте CACHE_BACKEND=redis', workers)
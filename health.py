@@ -0,0 +1,53 @@
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+
+from models import db
+from write_queue import write_queue
+
+# /healthz — процесс жив и отвечает, база не трогается.
+# /readyz — база доступна и в пуле есть свободные соединения; балансировщик
+# перестаёт слать запросы в воркер, пока тот отвечает 503.
+health = Blueprint('health', __name__)
+
+
+def pool_status():
+    pool = db.engine.pool
+    status = {'class': type(pool).__name__}
+    if not hasattr(pool, 'checkedout'):
+        return status
+
+    size = pool.size()
+    capacity = size + max(getattr(pool, '_max_overflow', 0), 0)
+    checked_out = pool.checkedout()
+    status.update({
+        'size': size,
+        'capacity': capacity,
+        'checked_in': pool.checkedin(),
+        'checked_out': checked_out,
+        'overflow': max(pool.overflow(), 0),
+        'saturation': round(checked_out / capacity, 3) if capacity else 0,
+    })
+    return status
+
+
+@health.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+
+@health.route('/readyz')
+def readyz():
+    payload = {'status': 'ok', 'pool': pool_status(), 'write_queue': write_queue.depth()}
+
+    # При исчерпанном пуле проверочное соединение ждало бы pool_timeout
+    if payload['pool'].get('saturation', 0) >= current_app.config.get('READY_POOL_SATURATION', 0.9):
+        payload['status'] = 'saturated'
+        return jsonify(payload), 503
+
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    except Exception as e:
+        payload.update(status='unavailable', error=str(e))
+        return jsonify(payload), 503
+    return jsonify(payload)
@@ -0,0 +1,39 @@
+import math
+
+# Чистые функции без Flask и SQLAlchemy: их импортирует normalize.py, который
+# выполняется в дочерних процессах загрузчика, а также models.py и geo.py.
+
+
+# Отображение скидки и рейтинга: работают и с объектом Location, и со строкой запроса
+def format_discount(discount_min, discount_max, discount_value=None):
+    if discount_min is not None and discount_max is not None:
+        if discount_min == discount_max:
+            return f"{int(discount_min)}%"
+        return f"{int(discount_min)}-{int(discount_max)}%"
+    elif discount_min is not None:
+        return f"{int(discount_min)}%"
+    elif discount_max is not None:
+        return f"{int(discount_max)}%"
+    elif discount_value:
+        return discount_value
+    return "По социальной карте"
+
+
+def average_rating(rating_sum, reviews_count):
+    if not reviews_count:
+        return 0
+    return round(rating_sum / reviews_count, 1)
+
+
+# Сетка 0.01° (~1.1 км по широте): номер ячейки = строка * LON_CELLS + столбец,
+# поэтому строка сетки в bbox превращается в один диапазон по индексу geo_cell
+CELL_DEG = 0.01
+LON_CELLS = int(round(360 / CELL_DEG))
+
+
+def cell_for(lat, lon):
+    if lat is None or lon is None:
+        return None
+    row = int(math.floor((lat + 90) / CELL_DEG))
+    col = int(math.floor((lon + 180) / CELL_DEG)) % LON_CELLS
+    return row * LON_CELLS + col
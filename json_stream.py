@@ -0,0 +1,104 @@
+import gzip
+import json
+
+CHUNK_SIZE = 64 * 1024
+MAX_BUFFER_BYTES = 16 * 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+def open_source(path, encoding='cp1251'):
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding=encoding)
+    return open(path, 'r', encoding=encoding)
+
+
+def _skip_whitespace(buffer, pos):
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+# Разбирает массив верхнего уровня по одному элементу. В памяти держится
+# только текущий кусок файла, а он не может вырасти больше max_buffer символов.
+def iter_json_array(f, chunk_size=CHUNK_SIZE, max_buffer=MAX_BUFFER_BYTES):
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        if len(buffer) > max_buffer:
+            raise JSONStreamError(f'Элемент JSON больше {max_buffer} символов')
+
+    while True:
+        pos = _skip_whitespace(buffer, pos)
+        if pos < len(buffer):
+            break
+        if eof:
+            raise JSONStreamError('Пустой файл')
+        fill()
+    if buffer[pos] == '\ufeff':
+        pos = _skip_whitespace(buffer, pos + 1)
+    if buffer[pos] != '[':
+        raise JSONStreamError('Ожидается массив JSON')
+    pos += 1
+
+    expect_item = True
+    while True:
+        pos = _skip_whitespace(buffer, pos)
+        if pos >= len(buffer):
+            if eof:
+                raise JSONStreamError('Неожиданный конец файла')
+            fill()
+            continue
+
+        ch = buffer[pos]
+        if ch == ']':
+            return
+        if not expect_item:
+            if ch != ',':
+                raise JSONStreamError(f'Ожидается запятая, найдено {ch!r}')
+            pos += 1
+            expect_item = True
+            continue
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # Число может оборваться на границе куска: дочитываем, пока за ним нет разделителя
+        if not eof and (end >= len(buffer) or buffer[end] not in _DELIMITERS):
+            fill()
+            continue
+        yield item
+        pos = end
+        expect_item = False
+
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,83 @@
+import math
+
+from models import db, Location
+from pagination import keyset_page, approximate_count, page_size_from
+from search import search_subquery
+from categories import resolve_category
+from cache import cache
+
+# Общий список мест для главной, /api/locations и /api/v1/locations
+SORTS = ('', 'discount')
+
+
+def float_arg(args, name):
+    try:
+        value = float(args.get(name, ''))
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def listing_sort(args):
+    sort = args.get('sort', '')
+    return sort if sort in SORTS else ''
+
+
+# columns — если заданы, запрос возвращает кортежи этих колонок вместо объектов Location
+def listing_query(category, search_query, discount_from=None, discount_to=None, sort='', columns=None):
+    locations = (db.session.query(*columns) if columns else Location.query).filter(Location.visible())
+    # По умолчанию сначала места с подтверждённой голосами скидкой, см. scoring.py
+    order = [(Location.validity_score, True), (Location.id, True)]
+
+    if search_query:
+        matches = search_subquery(search_query)
+        if matches is None:
+            locations = locations.filter(db.false())
+        else:
+            locations = locations.join(matches, matches.c.location_id == Location.id)
+            if sort != 'discount':
+                locations = locations.add_columns(matches.c.score)
+                order = [(matches.c.score, True), (Location.id, False)]
+
+    if category:
+        category_id = resolve_category(category)
+        locations = locations.filter(Location.category_id == category_id if category_id else db.false())
+
+    # Диапазоны пересекаются: место подходит, если его скидка может попасть в [from, to]
+    if discount_from is not None:
+        locations = locations.filter(Location.discount_max >= discount_from)
+    if discount_to is not None:
+        locations = locations.filter(Location.discount_min <= discount_to)
+
+    if sort == 'discount':
+        order = [(Location.discount_max, True), (Location.id, True)]
+
+    return locations, order
+
+
+def location_listing(args, columns=None):
+    limit = page_size_from(args.get('per_page'))
+    query, order = listing_query(args.get('category', ''), args.get('search', '').strip(),
+                                 discount_from=float_arg(args, 'discount_from'),
+                                 discount_to=float_arg(args, 'discount_to'),
+                                 sort=listing_sort(args),
+                                 columns=columns)
+    if columns is None and len(query.column_descriptions) > 1:
+        rows, next_cursor = keyset_page(query, order, args.get('after'), limit,
+                                        cursor_key=lambda row: [row.score, row.Location.id])
+        rows = [row.Location for row in rows]
+    else:
+        rows, next_cursor = keyset_page(query, order, args.get('after'), limit)
+    total, total_exact = approximate_count(query)
+    return rows, next_cursor, total, total_exact
+
+
+def listing_cache_key(route, args):
+    return cache.page_key(route,
+                          category=args.get('category', ''),
+                          search=args.get('search', '').strip(),
+                          discount_from=args.get('discount_from', ''),
+                          discount_to=args.get('discount_to', ''),
+                          sort=listing_sort(args),
+                          page=args.get('after', ''),
+                          per_page=args.get('per_page', ''))
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Метрики запросов: время ответа по маршрутам, число и время SQL-запросов,
+# время рендеринга шаблонов и медленные запросы. Счётчики живут в памяти
+# процесса, поэтому при нескольких воркерах gunicorn /metrics отдаёт данные
+# того воркера, который ответил; Prometheus различает их по instance.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Сколько SQL-запросов ожидается от маршрута. Превышение пишется в лог:
+# так N+1 в шаблонах видно сразу, а не по жалобам пользователей. В бюджет
+# входят проверки версий кэша из app_meta (не чаще раза в CACHE_VERSION_CHECK).
+DEFAULT_QUERY_BUDGET = 10
+QUERY_BUDGETS = {
+    'main.index': 4,
+    'main.location_detail': 4,
+    'main.api_locations': 3,
+    'main.favorites': 2,
+    'api_v1.locations': 4,
+    'api_v1.location_detail': 4,
+    'api_v1.location_reviews': 4,
+}
+
+MAX_LOGGED_PARAMS = 500
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        copy = Histogram(self.buckets)
+        copy.counts, copy.sum, copy.count = list(self.counts), self.sum, self.count
+        return copy
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield f'{name}_bucket{_labels(labels, le=le)} {cumulative}'
+        yield f'{name}_sum{_labels(labels)} {self.sum:.6f}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.slow_query_seconds = 0.2
+        self.server_timing = False
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._statements = {}
+        self._requests = {}
+        self._sql_seconds = {}
+        self._template_seconds = {}
+        self._budget_exceeded = {}
+        self._slow_queries = 0
+        self._listening = False
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_seconds = float(app.config.get('SLOW_QUERY_MS', 200)) / 1000
+        self.server_timing = bool(app.config.get('SERVER_TIMING'))
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.extensions['metrics'] = self
+
+    # Дополнительные метрики (кэш, пул, очередь): функция возвращает
+    # список (имя, тип, справка, [(метки, значение)])
+    def collector(self, func):
+        self._collectors.append(func)
+        return func
+
+    def _before_request(self):
+        g.metrics_started_at = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.template_seconds = 0.0
+        g.template_started_at = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_started_at')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            with self._lock:
+                self._slow_queries += 1
+            params = repr(parameters)
+            if len(params) > MAX_LOGGED_PARAMS:
+                params = params[:MAX_LOGGED_PARAMS] + '...'
+            logger.warning('Медленный запрос %.1f мс%s: %s; параметры: %s', elapsed * 1000,
+                           f' ({request.endpoint})' if has_request_context() else '',
+                           ' '.join(statement.split()), params)
+
+    def _before_render(self, sender, template, context, **extra):
+        if 'template_started_at' in g:
+            g.template_started_at.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        if g.get('template_started_at'):
+            g.template_seconds += time.perf_counter() - g.template_started_at.pop()
+
+    def _after_request(self, response):
+        if 'metrics_started_at' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started_at
+        endpoint = request.endpoint or 'unmatched'
+        key = (endpoint, request.method)
+
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(g.sql_count)
+            status_key = key + (response.status_code,)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            self._sql_seconds[key] = self._sql_seconds.get(key, 0.0) + g.sql_seconds
+            self._template_seconds[key] = self._template_seconds.get(key, 0.0) + g.template_seconds
+
+        budget = QUERY_BUDGETS.get(endpoint, DEFAULT_QUERY_BUDGET)
+        if g.sql_count > budget:
+            with self._lock:
+                self._budget_exceeded[endpoint] = self._budget_exceeded.get(endpoint, 0) + 1
+            logger.warning('%s %s: %d SQL-запросов при бюджете %d', request.method, request.full_path,
+                           g.sql_count, budget)
+
+        if self.server_timing:
+            response.headers.add('Server-Timing', ', '.join([
+                f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_count} queries"',
+                f'tpl;dur={g.template_seconds * 1000:.1f}',
+                f'app;dur={elapsed * 1000:.1f}',
+            ]))
+        return response
+
+    def _lines(self):
+        with self._lock:
+            histograms = [
+                ('http_request_duration_seconds', 'Время ответа по маршрутам',
+                 [(key, hist.snapshot()) for key, hist in sorted(self._latency.items())]),
+                ('db_statements_per_request', 'Число SQL-запросов за один HTTP-запрос',
+                 [(key, hist.snapshot()) for key, hist in sorted(self._statements.items())]),
+            ]
+            counters = [
+                ('http_requests_total', 'Число ответов по маршрутам и кодам',
+                 [([('endpoint', endpoint), ('method', method), ('status', status)], count)
+                  for (endpoint, method, status), count in sorted(self._requests.items())]),
+                ('db_statement_seconds_total', 'Суммарное время SQL-запросов',
+                 [([('endpoint', endpoint), ('method', method)], f'{seconds:.6f}')
+                  for (endpoint, method), seconds in sorted(self._sql_seconds.items())]),
+                ('template_render_seconds_total', 'Суммарное время рендеринга шаблонов',
+                 [([('endpoint', endpoint), ('method', method)], f'{seconds:.6f}')
+                  for (endpoint, method), seconds in sorted(self._template_seconds.items())]),
+                ('db_query_budget_exceeded_total', 'Ответы, превысившие бюджет SQL-запросов',
+                 [([('endpoint', endpoint)], count) for endpoint, count in sorted(self._budget_exceeded.items())]),
+                ('db_slow_queries_total', 'Запросы дольше SLOW_QUERY_MS', [([], self._slow_queries)]),
+            ]
+
+        for name, help_text, series in histograms:
+            yield f'# HELP {name} {help_text}'
+            yield f'# TYPE {name} histogram'
+            for (endpoint, method), hist in series:
+                yield from hist.samples(name, [('endpoint', endpoint), ('method', method)])
+
+        families = [(name, 'counter', help_text, samples) for name, help_text, samples in counters]
+        for collect in self._collectors:
+            families.extend(collect())
+        for name, kind, help_text, samples in families:
+            yield f'# HELP {name} {help_text}'
+            yield f'# TYPE {name} {kind}'
+            for labels, value in samples:
+                yield f'{name}{_labels(labels)} {value}'
+
+    def export(self):
+        return Response('\n'.join(self._lines()) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -0,0 +1,248 @@
+from sqlalchemy import inspect, text
+
+from models import db, Location, SchemaMigration, reconcile_location_stats
+from geo import backfill_geo_cells
+from categories import backfill_category_ids, refresh_facets
+from normalize import parse_discount_text
+from recommendations import rebuild_similar
+from scoring import score_locations
+from search import reindex_all
+from clusters import rebuild_clusters
+
+# Каждая миграция идемпотентна: проверяет схему перед изменением, поэтому её
+# можно применять к базе, созданной через db.create_all() или старым migrate_database().
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+def _columns(table):
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def _indexes(table):
+    inspector = inspect(db.engine)
+    names = {index['name'] for index in inspector.get_indexes(table)}
+    names.update(constraint['name'] for constraint in inspector.get_unique_constraints(table))
+    return names
+
+
+def add_column(table, column, ddl):
+    if column in _columns(table):
+        return False
+    print(f"Добавляю столбец {table}.{column}...")
+    with db.engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def create_index(table, name, columns):
+    if name in _indexes(table):
+        return False
+    print(f"Создаю индекс {name}...")
+    with db.engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+# refresh_facets, rebuild_clusters и rebuild_similar отбирают места через Location.visible(),
+# поэтому столбцы оценки актуальности нужны уже миграциям 6–8, а не только девятой
+def _validity_columns():
+    add_column('locations', 'validity_score', 'FLOAT NOT NULL DEFAULT 0')
+    add_column('locations', 'is_stale', 'BOOLEAN NOT NULL DEFAULT 0')
+    add_column('locations', 'validity_scored_at', 'DATETIME NULL')
+
+
+@migration(1, 'Диапазон скидки')
+def _discount_range():
+    add_column('locations', 'discount_min', 'FLOAT NULL')
+    add_column('locations', 'discount_max', 'FLOAT NULL')
+
+
+@migration(2, 'Агрегаты отзывов и голосов')
+def _location_aggregates():
+    for column in ('reviews_count', 'rating_sum', 'valid_votes', 'invalid_votes'):
+        add_column('locations', column, 'INTEGER NOT NULL DEFAULT 0')
+    # Заполнение не зависит от того, добавлены ли столбцы сейчас: сверка правит только расхождения
+    fixed = reconcile_location_stats()
+    if fixed:
+        print(f"✓ Заполнены агрегаты отзывов и голосов для {fixed} мест")
+
+
+@migration(3, 'Геосетка')
+def _geo_cell():
+    add_column('locations', 'geo_cell', 'INTEGER NULL')
+    create_index('locations', 'ix_locations_geo_cell', ['geo_cell'])
+    updated = backfill_geo_cells()
+    if updated:
+        print(f"✓ Заполнены ячейки геосетки для {updated} мест")
+
+
+@migration(4, 'Синхронизация с выгрузкой')
+def _sync_columns():
+    add_column('locations', 'source_id', 'VARCHAR(64) NULL')
+    add_column('locations', 'content_hash', 'VARCHAR(40) NULL')
+    add_column('locations', 'deleted_at', 'DATETIME NULL')
+    create_index('locations', 'ix_locations_source_id', ['source_id'])
+
+
+@migration(5, 'Индексы для частых запросов')
+def _hot_query_indexes():
+    create_index('locations', 'ix_locations_category', ['category'])
+    create_index('locations', 'ix_locations_name_address', ['name', 'address'])
+    create_index('locations', 'ix_locations_lat_lon', ['latitude', 'longitude'])
+    create_index('reviews', 'ix_reviews_location_created', ['location_id', 'created_at'])
+    create_index('discount_votes', 'ix_discount_votes_location_valid', ['location_id', 'is_valid'])
+    # favorites(user_id) уже покрыт уникальным индексом unique_user_location (user_id, location_id)
+
+
+@migration(6, 'Канонические категории и фасеты')
+def _categories():
+    add_column('locations', 'category_id', 'INTEGER NULL REFERENCES categories(id)')
+    create_index('locations', 'ix_locations_category_id', ['category_id'])
+    _validity_columns()
+    # Категории проставляются только местам без category_id, фасеты пересчитываются всегда
+    refreshed = backfill_category_ids()
+    print(f"✓ Проставлены категории, пересчитаны фасеты для {refreshed} категорий")
+
+
+def _backfill_discount_ranges():
+    updated = 0
+    texts = [value for (value,) in
+             db.session.query(Location.discount_value)
+             .filter(Location.discount_min.is_(None), Location.discount_max.is_(None),
+                     Location.discount_value.isnot(None))
+             .distinct()]
+    for value in texts:
+        discount_min, discount_max = parse_discount_text(value)
+        if discount_min is None:
+            continue
+        updated += db.session.query(Location).filter(
+            Location.discount_value == value, Location.discount_min.is_(None), Location.discount_max.is_(None)
+        ).update({Location.discount_min: discount_min, Location.discount_max: discount_max},
+                 synchronize_session=False)
+
+    updated += db.session.query(Location).filter(Location.discount_min.is_(None), Location.discount_max.isnot(None)) \
+        .update({Location.discount_min: Location.discount_max}, synchronize_session=False)
+    updated += db.session.query(Location).filter(Location.discount_max.is_(None), Location.discount_min.isnot(None)) \
+        .update({Location.discount_max: Location.discount_min}, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+
+@migration(7, 'Числовые границы скидки')
+def _discount_numbers():
+    create_index('locations', 'ix_locations_discount_max', ['discount_max', 'id'])
+    create_index('locations', 'ix_locations_category_discount_max', ['category_id', 'discount_max', 'id'])
+    _validity_columns()
+    updated = _backfill_discount_ranges()
+    refresh_facets()
+    if updated:
+        print(f"✓ Заполнены числовые границы скидки для {updated} мест")
+
+
+@migration(8, 'Похожие места')
+def _similar_locations():
+    # Таблицы location_similar и similar_stale создаёт create_all, здесь только первый расчёт
+    _validity_columns()
+    built = rebuild_similar()
+    if built:
+        print(f"✓ Рассчитаны похожие места для {built} мест")
+
+
+@migration(9, 'Актуальность скидок по голосам')
+def _validity_scores():
+    _validity_columns()
+    if add_column('discount_votes', 'updated_at', 'DATETIME NULL'):
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE discount_votes SET updated_at = created_at"))
+    create_index('locations', 'ix_locations_validity', ['validity_score', 'id'])
+    create_index('locations', 'ix_locations_category_validity', ['category_id', 'validity_score', 'id'])
+    create_index('discount_votes', 'ix_discount_votes_updated_location', ['updated_at', 'location_id'])
+    scored, changed = score_locations(full=True)
+    if changed:
+        print(f"✓ Оценена актуальность скидок для {changed} мест")
+
+
+@migration(10, 'Время пересчёта актуальности')
+def _validity_scored_at():
+    _validity_columns()
+    create_index('locations', 'ix_locations_stale', ['is_stale', 'id'])
+    create_index('locations', 'ix_locations_validity_scored_at', ['validity_scored_at'])
+    # Полный пересчёт проставляет время оценки всем местам с голосами
+    scored, changed = score_locations(full=True)
+    if scored:
+        print(f"✓ Пересчитана актуальность скидок для {scored} мест")
+
+
+@migration(11, 'Поисковый индекс')
+def _search_index():
+    # Таблицу search_terms создаёт create_all, загрузчик индексирует только новые места
+    indexed = reindex_all()
+    if indexed:
+        print(f"✓ Поисковый индекс построен, терминов: {indexed}")
+
+
+@migration(12, 'Кластеры карты')
+def _map_clusters():
+    # Таблицу map_clusters создаёт create_all, здесь первый расчёт для уже загруженных мест
+    created = rebuild_clusters()
+    if created:
+        print(f"✓ Кластеры карты рассчитаны: {created}")
+
+
+@migration(13, 'Актуальность скидок относительно мест без голосов')
+def _neutral_validity():
+    # Оценки, посчитанные без априорных голосов, ставили любое место с голосом «действует» выше мест без голосов
+    scored, changed = score_locations(full=True)
+    if changed:
+        print(f"✓ Пересчитана актуальность скидок для {changed} мест")
+
+
+def applied_versions():
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return set()
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [entry for entry in sorted(MIGRATIONS) if entry[0] not in applied]
+
+
+def upgrade():
+    # Новые таблицы создаются целиком, миграции нужны только для изменения существующих
+    db.create_all()
+
+    pending = pending_migrations()
+    for version, name, func in pending:
+        try:
+            func()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠ Ошибка в миграции {version} ({name}): {e}")
+            raise
+        db.session.add(SchemaMigration(version=version, name=name))
+        db.session.commit()
+        print(f"✓ Миграция {version}: {name}")
+
+    if not pending:
+        print("✓ Схема базы данных актуальна")
+    return len(pending)
+
+
+def status():
+    applied = applied_versions()
+    return [(version, name, version in applied) for version, name, _ in sorted(MIGRATIONS)]
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    with create_app().app_context():
+        upgrade()
@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
+from helpers import format_discount, average_rating
+
 db = SQLAlchemy()
 
 class User(db.Model):
@@ -19,6 +21,30 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class Category(db.Model):
+    __tablename__ = 'categories'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    locations_count = db.Column(db.Integer, nullable=False, default=0)
+
+    facets = db.relationship('CategoryFacet', backref='category', lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
+
+class CategoryFacet(db.Model):
+    __tablename__ = 'category_facets'
+
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    band = db.Column(db.String(16), primary_key=True)  # диапазон скидки, см. categories.py
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CategoryFacet {self.category_id} {self.band}={self.count}>'
+
+
 class Location(db.Model):
     __tablename__ = 'locations'
     
@@ -26,42 +52,66 @@ class Location(db.Model):
     name = db.Column(db.String(200), nullable=False)
     address = db.Column(db.String(500), nullable=False)
     category = db.Column(db.String(100))
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), index=True)  # каноническая категория
     discount_value = db.Column(db.String(100))
     discount_min = db.Column(db.Float, nullable=True) 
     discount_max = db.Column(db.Float, nullable=True)  
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+    geo_cell = db.Column(db.Integer, index=True)  # ячейка сетки, см. geo.py
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Синхронизация с открытыми данными
+    source_id = db.Column(db.String(64), index=True)  # global_id из выгрузки
+    content_hash = db.Column(db.String(40))
+    deleted_at = db.Column(db.DateTime)  # пропала из выгрузки
+
+    # Агрегаты, обновляются вместе с отзывами и голосами
+    reviews_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    valid_votes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    invalid_votes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Оценка актуальности скидки по голосам, пересчитывается в scoring.py; 0 — голосов нет
+    validity_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    is_stale = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    validity_scored_at = db.Column(db.DateTime)  # когда оценка пересчитывалась в последний раз
     
     # Связи
     reviews = db.relationship('Review', backref='location', lazy=True, cascade='all, delete-orphan')
     favorites = db.relationship('Favorite', backref='location', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_locations_category', 'category'),
+        db.Index('ix_locations_name_address', 'name', 'address'),
+        db.Index('ix_locations_lat_lon', 'latitude', 'longitude'),
+        db.Index('ix_locations_discount_max', 'discount_max', 'id'),
+        db.Index('ix_locations_category_discount_max', 'category_id', 'discount_max', 'id'),
+        db.Index('ix_locations_validity', 'validity_score', 'id'),
+        db.Index('ix_locations_category_validity', 'category_id', 'validity_score', 'id'),
+        db.Index('ix_locations_stale', 'is_stale', 'id'),
+        db.Index('ix_locations_validity_scored_at', 'validity_scored_at'),
+    )
     
+    @classmethod
+    def listed(cls):
+        return cls.deleted_at.is_(None)
+
+    # Для списков, карты и подборок: без мест, чья скидка по голосам больше не действует.
+    # Страница места и избранное по-прежнему используют listed()
+    @classmethod
+    def visible(cls):
+        return db.and_(cls.deleted_at.is_(None), cls.is_stale.is_(False))
+
     def get_average_rating(self):
-        reviews = Review.query.filter_by(location_id=self.id).all()
-        if not reviews:
-            return 0
-        total_rating = sum(review.rating for review in reviews)
-        return round(total_rating / len(reviews), 1)
+        return average_rating(self.rating_sum, self.reviews_count)
     
     def get_reviews_count(self):
-        return Review.query.filter_by(location_id=self.id).count()
+        return self.reviews_count or 0
     
     def get_discount_display(self):
-        if self.discount_min is not None and self.discount_max is not None:
-            if self.discount_min == self.discount_max:
-                return f"{int(self.discount_min)}%"
-            else:
-                return f"{int(self.discount_min)}-{int(self.discount_max)}%"
-        elif self.discount_min is not None:
-            return f"{int(self.discount_min)}%"
-        elif self.discount_max is not None:
-            return f"{int(self.discount_max)}%"
-        elif self.discount_value:
-            return self.discount_value
-        else:
-            return "По социальной карте"
+        return format_discount(self.discount_min, self.discount_max, self.discount_value)
     
     def __repr__(self):
         return f'<Location {self.name}>'
@@ -75,6 +125,8 @@ class Review(db.Model):
     text = db.Column(db.Text, nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_reviews_location_created', 'location_id', 'created_at'),)
     
     def __repr__(self):
         return f'<Review {self.id} by User {self.user_id}>'
@@ -101,8 +153,158 @@ class DiscountVote(db.Model):
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
     is_valid = db.Column(db.Boolean, nullable=False, default=True)  # True = скидка действует
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # последнее изменение голоса
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'location_id', name='unique_user_location_vote'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'location_id', name='unique_user_location_vote'),
+        db.Index('ix_discount_votes_location_valid', 'location_id', 'is_valid'),
+        db.Index('ix_discount_votes_updated_location', 'updated_at', 'location_id'),
+    )
 
     def __repr__(self):
         return f'<DiscountVote User {self.user_id} Location {self.location_id} Valid={self.is_valid}>'
+
+
+class SyncCheckpoint(db.Model):
+    __tablename__ = 'sync_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), nullable=False, index=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    seen_count = db.Column(db.Integer, nullable=False, default=0)
+    inserted_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_count = db.Column(db.Integer, nullable=False, default=0)
+    deleted_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SyncCheckpoint {self.source} {self.fingerprint[:8]}>'
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
+
+
+class AppMeta(db.Model):
+    __tablename__ = 'app_meta'
+
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AppMeta {self.key}={self.value}>'
+
+
+def get_meta(key, default=0):
+    value = db.session.query(AppMeta.value).filter_by(key=key).scalar()
+    return default if value is None else value
+
+
+def bump_meta(key):
+    updated = db.session.query(AppMeta).filter_by(key=key).update(
+        {AppMeta.value: AppMeta.value + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(AppMeta(key=key, value=1))
+    db.session.commit()
+    return get_meta(key)
+
+
+def set_meta(key, value):
+    db.session.merge(AppMeta(key=key, value=value))
+    db.session.commit()
+
+
+class SearchTerm(db.Model):
+    __tablename__ = 'search_terms'
+
+    term = db.Column(db.String(64), primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), primary_key=True, index=True)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<SearchTerm {self.term} Location {self.location_id}>'
+
+
+class MapCluster(db.Model):
+    __tablename__ = 'map_clusters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    zoom = db.Column(db.Integer, nullable=False)
+    cell_x = db.Column(db.Integer, nullable=False)
+    cell_y = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'))  # если точка одна
+
+    __table_args__ = (db.Index('ix_map_clusters_zoom_cell', 'zoom', 'cell_x', 'cell_y'),)
+
+    def __repr__(self):
+        return f'<MapCluster z{self.zoom} ({self.cell_x}, {self.cell_y}) x{self.count}>'
+
+
+class LocationSimilar(db.Model):
+    __tablename__ = 'location_similar'
+
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    similar_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<LocationSimilar {self.location_id} #{self.rank} -> {self.similar_id}>'
+
+
+# Места, у которых после отзывов и избранного пора пересчитать похожие
+class SimilarStale(db.Model):
+    __tablename__ = 'similar_stale'
+
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), primary_key=True)
+
+    def __repr__(self):
+        return f'<SimilarStale {self.location_id}>'
+
+
+def reconcile_location_stats():
+    review_stats = dict(
+        (location_id, (count, total))
+        for location_id, count, total in db.session.query(
+            Review.location_id, db.func.count(Review.id), db.func.coalesce(db.func.sum(Review.rating), 0)
+        ).group_by(Review.location_id)
+    )
+    vote_stats = dict(
+        (location_id, (int(valid or 0), int(invalid or 0)))
+        for location_id, valid, invalid in db.session.query(
+            DiscountVote.location_id,
+            db.func.sum(db.case((DiscountVote.is_valid.is_(True), 1), else_=0)),
+            db.func.sum(db.case((DiscountVote.is_valid.is_(False), 1), else_=0)),
+        ).group_by(DiscountVote.location_id)
+    )
+
+    fixed = 0
+    rows = db.session.query(
+        Location.id, Location.reviews_count, Location.rating_sum, Location.valid_votes, Location.invalid_votes
+    ).all()
+    for location_id, reviews_count, rating_sum, valid_votes, invalid_votes in rows:
+        count, total = review_stats.get(location_id, (0, 0))
+        valid, invalid = vote_stats.get(location_id, (0, 0))
+        if (reviews_count, rating_sum, valid_votes, invalid_votes) != (count, int(total), valid, invalid):
+            db.session.query(Location).filter_by(id=location_id).update({
+                Location.reviews_count: count,
+                Location.rating_sum: int(total),
+                Location.valid_votes: valid,
+                Location.invalid_votes: invalid,
+            }, synchronize_session=False)
+            fixed += 1
+
+    db.session.commit()
+    return fixed
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers import cell_for, format_discount
+from json_stream import iter_batches
+
+# Разбор и фильтрация записей выгрузки. Функции здесь чистые и не трогают базу,
+# поэтому их можно выполнять в дочерних процессах: модуль не импортирует ни
+# Flask, ни SQLAlchemy.
+
+# Порядок важен: запись попадает в первую категорию, название которой
+# входит в её исходную категорию
+ALLOWED_CATEGORIES = (
+    'Аптека',
+    'Магазин',
+    'Продовольственные',
+    'Предприятия услуг',
+    'Общественное питание',
+    'Кафе',
+    'Столовая',
+    'Бытовые услуги',
+    'Книги',
+    'Одежда',
+    'Обувь'
+)
+
+MIN_DISCOUNT_KEYS = [
+    'Минимальный размер скидки, %',
+    'Минимальный размер скидки',
+    'MinDiscountSize',
+    'MinDiscount',
+    'DiscountMin',
+    'discount_min',
+    'MinimumDiscount'
+]
+
+MAX_DISCOUNT_KEYS = [
+    'Максимальный размер скидки, %',
+    'Максимальный размер скидки',
+    'MaxDiscountSize',
+    'MaxDiscount',
+    'DiscountMax',
+    'discount_max',
+    'MaximumDiscount'
+]
+
+def _parse_discount(item, keys):
+    for key in keys:
+        if key in item and item[key] is not None:
+            try:
+                value = item[key]
+                if isinstance(value, str):
+                    value = value.replace('%', '').replace(',', '.').strip()
+                return float(value)
+            except (ValueError, TypeError):
+                continue
+    return None
+
+# «10%», «5,5 %», «от 5 до 15%», «5-15%»: берутся только числа, к которым относится знак процента
+_DISCOUNT_TEXT = re.compile(
+    r'(?:от\s*)?(\d+(?:[.,]\d+)?)\s*%?\s*(?:-|–|—|до)\s*(\d+(?:[.,]\d+)?)\s*%'
+    r'|(\d+(?:[.,]\d+)?)\s*%',
+    re.IGNORECASE,
+)
+
+def parse_discount_text(text):
+    values = []
+    for match in _DISCOUNT_TEXT.finditer(text or ''):
+        values.extend(float(group.replace(',', '.')) for group in match.groups() if group)
+    values = [value for value in values if 0 < value <= 100]
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+def canonical_category(category):
+    lowered = (category or '').lower()
+    for cat in ALLOWED_CATEGORIES:
+        if cat.lower() in lowered:
+            return cat
+    return None
+
+def normalize_item(item):
+    name = (item.get('Name') or item.get('CommonName') or '').strip()
+    address = (item.get('Address') or item.get('AddressString') or '').strip()
+    category = (item.get('Category') or item.get('ObjectCategory') or '').strip()
+    
+    discount = (item.get('Discount') or item.get('DiscountSize') or 'По социальной карте').strip()
+    description = (item.get('Description') or item.get('Note') or '').strip()
+    
+    discount_min = _parse_discount(item, MIN_DISCOUNT_KEYS)
+    discount_max = _parse_discount(item, MAX_DISCOUNT_KEYS)
+
+    if not name or not address:
+        return None
+
+    if 'москв' not in address.lower():
+        return None
+
+    if discount_min is None and discount_max is None and not discount:
+        return None
+
+    canonical = canonical_category(category)
+    if canonical is None:
+        return None
+
+    latitude = None
+    longitude = None
+    if 'geoData' in item and item['geoData']:
+        try:
+            geo = item['geoData']
+            if isinstance(geo, dict) and 'coordinates' in geo:
+                longitude = float(geo['coordinates'][0])
+                latitude = float(geo['coordinates'][1])
+        except (ValueError, TypeError, IndexError, KeyError):
+            pass
+
+    discount_value = format_discount(discount_min, discount_max, discount)
+    if discount_min is None and discount_max is None:
+        # Свободный текст разбирается в числа, чтобы запись не выпадала
+        # из фильтров и сортировки по скидке
+        discount_min, discount_max = parse_discount_text(discount)
+
+    # Одна известная граница считается обеими
+    if discount_min is None:
+        discount_min = discount_max
+    if discount_max is None:
+        discount_max = discount_min
+
+    source_id = item.get('global_id')
+    row = {
+        'source_id': str(source_id)[:64] if source_id not in (None, '') else None,
+        'name': name,
+        'address': address,
+        'category': category,
+        'canonical_category': canonical,
+        'discount_value': discount_value,
+        'discount_min': discount_min,
+        'discount_max': discount_max,
+        'latitude': latitude,
+        'longitude': longitude,
+        'geo_cell': cell_for(latitude, longitude),
+        'description': description,
+    }
+    row['content_hash'] = content_hash(row)
+    return row
+
+HASHED_FIELDS = ('name', 'address', 'category', 'discount_value', 'discount_min', 'discount_max',
+                 'latitude', 'longitude', 'description')
+
+def content_hash(row):
+    payload = json.dumps([row[field] for field in HASHED_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def normalize_chunk(items):
+    return [normalize_item(item) for item in items]
+
+# Выдаёт нормализованные пачки в исходном порядке: None на месте
+# отфильтрованных записей. При workers > 1 пачки разбираются в пуле
+# процессов, в работе держится не больше двух пачек на процесс.
+def normalized_batches(items, batch_size, workers=1):
+    batches = iter_batches(items, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield normalize_chunk(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(normalize_chunk, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
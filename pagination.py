@@ -0,0 +1,114 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select, func
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+APPROX_COUNT_CAP = 1000
+CURSOR_VALUE_TYPES = (str, int, float, bool, type(None))
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Нельзя положить в курсор значение {value!r}')
+
+
+def _coerce(column, value):
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if value is None:
+        return value
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError(f'Ожидалась дата, получено {value!r}')
+        return datetime.fromisoformat(value)
+    # Строка вместо числа дошла бы до драйвера и упала уже при выполнении запроса
+    if python_type in (int, float) and not isinstance(value, (int, float)):
+        return python_type(value)
+    return value
+
+
+# Курсор приходит от клиента: всё, кроме списка из не более size скаляров, считается его отсутствием
+def decode_cursor(cursor, size=None):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or (size is not None and len(values) > size):
+        return None
+    if not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values):
+        return None
+    return values
+
+
+def _after(column, value, descending):
+    # NULL считается меньше любого значения: в конце при DESC и в начале при ASC
+    if value is None:
+        if descending:
+            return None, column.is_(None)
+        return column.isnot(None), column.is_(None)
+    if descending:
+        return or_(column < value, column.is_(None)), column == value
+    return column > value, column == value
+
+
+# order: список (колонка, desc), последним идёт уникальный ключ
+def keyset_filter(order, values):
+    clauses = []
+    equal_prefix = []
+    for (column, descending), value in zip(order, values):
+        beyond, same = _after(column, _coerce(column, value), descending)
+        if beyond is not None:
+            clauses.append(and_(*equal_prefix, beyond))
+        equal_prefix.append(same)
+    return or_(*clauses)
+
+
+def keyset_page(query, order, cursor=None, limit=DEFAULT_PAGE_SIZE, cursor_key=None):
+    values = decode_cursor(cursor, len(order))
+    if values is not None and len(values) == len(order):
+        try:
+            query = query.filter(keyset_filter(order, values))
+        except ValueError:
+            pass
+
+    query = query.order_by(*[
+        column.desc() if descending else column.asc() for column, descending in order
+    ])
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if cursor_key is None:
+            cursor_key = lambda row: [getattr(row, column.key) for column, _ in order]
+        next_cursor = encode_cursor(cursor_key(rows[-1]))
+    return rows, next_cursor
+
+
+# Считает не больше cap + 1 строк, поэтому стоит одинаково на любой странице
+def approximate_count(query, cap=APPROX_COUNT_CAP):
+    limited = query.order_by(None).limit(cap + 1).subquery()
+    total = query.session.execute(select(func.count()).select_from(limited)).scalar() or 0
+    return min(total, cap), total <= cap
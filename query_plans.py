@@ -0,0 +1,98 @@
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db, Location, Review, Favorite, DiscountVote, SearchTerm, MapCluster, LocationSimilar
+from recommendations import similar_query
+import geo
+
+# Типичные запросы маршрутов. Для каждого проверяется, что по таблице
+# нет полного сканирования: EXPLAIN в MySQL, EXPLAIN QUERY PLAN в SQLite.
+SAMPLE_ID = 1
+SAMPLE_CATEGORY_ID = 1
+SAMPLE_BBOX = (55.70, 37.55, 55.80, 37.70)
+SAMPLE_SINCE = datetime(2024, 1, 1)
+
+
+def route_queries():
+    return [
+        ('index: фильтр по категории',
+         Location.query.filter(Location.visible(), Location.category_id == SAMPLE_CATEGORY_ID)
+         .order_by(Location.validity_score.desc(), Location.id.desc()).limit(31)),
+        ('index: сортировка по скидке',
+         Location.query.filter(Location.visible(), Location.discount_max >= 10)
+         .order_by(Location.discount_max.desc(), Location.id.desc()).limit(31)),
+        ('index: категория и сортировка по скидке',
+         Location.query.filter(Location.visible(), Location.category_id == SAMPLE_CATEGORY_ID, Location.discount_max >= 10)
+         .order_by(Location.discount_max.desc(), Location.id.desc()).limit(31)),
+        ('index: поиск по слову',
+         db.session.query(SearchTerm.location_id).filter(SearchTerm.term >= 'аптек', SearchTerm.term < 'аптек\uffff')),
+        ('api/locations/nearby: bbox',
+         Location.query.filter(geo.bbox_condition(*SAMPLE_BBOX), Location.visible())),
+        ('api/map/clusters',
+         db.session.query(MapCluster).filter(MapCluster.zoom == 12, MapCluster.cell_x.between(0, 10 ** 6),
+                                            MapCluster.cell_y.between(0, 10 ** 6))),
+        ('location_detail: место',
+         Location.query.filter(Location.id == SAMPLE_ID)),
+        ('location_detail: отзывы',
+         Review.query.filter(Review.location_id == SAMPLE_ID).order_by(Review.created_at.desc()).limit(21)),
+        ('location_detail: похожие',
+         similar_query(SAMPLE_ID, limit=3)),
+        ('refresh-similar: кто ссылается на место',
+         db.session.query(LocationSimilar.location_id).filter(LocationSimilar.similar_id == SAMPLE_ID)),
+        ('reconcile: голоса места',
+         db.session.query(DiscountVote.id).filter(DiscountVote.location_id == SAMPLE_ID,
+                                                  DiscountVote.is_valid.is_(True))),
+        ('score-validity: новые голоса',
+         db.session.query(DiscountVote.location_id).filter(DiscountVote.updated_at >= SAMPLE_SINCE)),
+        ('score-validity: скрытые места',
+         db.session.query(Location.id).filter(Location.is_stale.is_(True))),
+        ('score-validity: давно не пересчитанные',
+         db.session.query(Location.id).filter(Location.validity_scored_at < SAMPLE_SINCE)),
+        ('favorites',
+         Favorite.query.filter(Favorite.user_id == SAMPLE_ID)),
+        ('data_loader: поиск по адресу',
+         Location.query.filter(Location.name == 'Аптека', Location.address == 'Москва')),
+        ('data_loader --sync: global_id',
+         Location.query.filter(Location.source_id == '1')),
+    ]
+
+
+def _compile(query):
+    statement = query.statement if hasattr(query, 'statement') else query
+    return str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+
+
+# SCAN — полный проход по таблице или по всему индексу, SEARCH — поиск по индексу
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def _full_scans(sql):
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == 'sqlite':
+            rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql)).mappings().all()
+            return [
+                match.group(1) for match in (_SQLITE_SCAN.match(row['detail']) for row in rows) if match
+            ], [row['detail'] for row in rows]
+        if dialect == 'mysql':
+            rows = conn.execute(text('EXPLAIN ' + sql)).mappings().all()
+            return [
+                row['table'] for row in rows if row.get('type') in ('ALL', 'index')
+            ], [f"{row['table']}: type={row.get('type')} key={row.get('key')}" for row in rows]
+    raise RuntimeError(f'EXPLAIN для {dialect} не поддерживается')
+
+
+def check_query_plans(verbose=False):
+    failures = []
+    for name, query in route_queries():
+        scanned, plan = _full_scans(_compile(query))
+        ok = not scanned
+        print(f"{'✓' if ok else '✗'} {name}" + ('' if ok else f" — полный проход по {', '.join(scanned)}"))
+        if verbose or not ok:
+            for line in plan:
+                print(f"    {line}")
+        if not ok:
+            failures.append(name)
+    return failures
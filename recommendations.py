@@ -0,0 +1,242 @@
+import heapq
+import math
+from collections import namedtuple, defaultdict
+
+from sqlalchemy.orm import aliased
+
+from models import db, Location, Favorite, LocationSimilar, SimilarStale
+import geo
+
+# Похожие места считаются заранее и хранятся по TOP_K на место в location_similar,
+# страница места читает их одним запросом по первичному ключу. Полный пересчёт —
+# после импорта, точечный — для мест из similar_stale (отзывы и избранное)
+# при разборе очереди записи или командой flask refresh-similar.
+TOP_K = 6
+NEIGHBOURS = 30  # ближайших кандидатов по расстоянию
+RADIUS_KM = 3
+CATEGORY_CANDIDATES = 10  # места той же категории с наибольшей скидкой, если рядом мало
+COFAVORITE_CANDIDATES = 20
+MAX_USER_FAVORITES = 200  # при полном пересчёте длинные списки дают слишком много пар
+GRID_DEG = 0.0025
+
+# Вклад признаков в оценку, каждый признак нормирован к [0, 1]
+WEIGHTS = {
+    'proximity': 0.35,
+    'category': 0.25,
+    'cofavorites': 0.2,
+    'rating': 0.1,
+    'discount': 0.1,
+}
+PROXIMITY_KM = 1.0
+MAX_DISCOUNT = 50
+# Сглаживание рейтинга: место без отзывов получает PRIOR_RATING
+PRIOR_RATING = 3.5
+PRIOR_REVIEWS = 3
+
+SIMILAR_COLUMNS = (
+    Location.id, Location.latitude, Location.longitude, Location.category_id,
+    Location.discount_min, Location.discount_max, Location.rating_sum, Location.reviews_count,
+)
+Candidate = namedtuple('Candidate', 'id latitude longitude category_id discount_min discount_max rating_sum reviews_count')
+
+
+def _has_point(row):
+    return row.latitude is not None and row.longitude is not None
+
+
+# На расстояниях в несколько километров плоская проекция почти не отличается от гаверсинуса и заметно дешевле
+def distance_km(base, other):
+    lon_scale = math.cos(math.radians(base.latitude))
+    return math.hypot(other.latitude - base.latitude, (other.longitude - base.longitude) * lon_scale) \
+        * geo.KM_PER_DEGREE
+
+
+# Часть оценки, которая зависит только от самого кандидата
+def own_score(other):
+    discount = other.discount_max if other.discount_max is not None else other.discount_min
+    rating = (other.rating_sum + PRIOR_RATING * PRIOR_REVIEWS) / ((other.reviews_count or 0) + PRIOR_REVIEWS)
+    return (WEIGHTS['rating'] * rating / 5
+            + WEIGHTS['discount'] * min(discount or 0, MAX_DISCOUNT) / MAX_DISCOUNT)
+
+
+def similarity(base, other, distance, cofavorites, own=None):
+    proximity = math.exp(-distance / PROXIMITY_KM) if distance is not None else 0.0
+    category = 1.0 if base.category_id is not None and other.category_id == base.category_id else 0.0
+    return (WEIGHTS['proximity'] * proximity
+            + WEIGHTS['category'] * category
+            + WEIGHTS['cofavorites'] * cofavorites / (cofavorites + 2)
+            + (own_score(other) if own is None else own))
+
+
+def top_similar(base, candidates, cofavorites, k=TOP_K, own_scores=None):
+    scored = []
+    for other in candidates:
+        if other.id == base.id:
+            continue
+        distance = distance_km(base, other) if _has_point(base) and _has_point(other) else None
+        own = own_scores[other.id] if own_scores is not None else None
+        scored.append((similarity(base, other, distance, cofavorites.get(other.id, 0), own), -other.id, other.id))
+    return [(location_id, score) for score, _, location_id in heapq.nlargest(k, scored)]
+
+
+def _store(ranked, replace=True):
+    if replace:
+        ids = list(ranked)
+        for start in range(0, len(ids), 1000):
+            db.session.query(LocationSimilar).filter(LocationSimilar.location_id.in_(ids[start:start + 1000])) \
+                .delete(synchronize_session=False)
+    rows = [
+        {'location_id': location_id, 'rank': rank, 'similar_id': similar_id, 'score': score}
+        for location_id, similar in ranked.items()
+        for rank, (similar_id, score) in enumerate(similar, 1)
+    ]
+    for start in range(0, len(rows), 5000):
+        db.session.execute(LocationSimilar.__table__.insert(), rows[start:start + 5000])
+
+
+def _grid_key(lat, lon):
+    return int(math.floor(lat / GRID_DEG)), int(math.floor(lon / GRID_DEG))
+
+
+def _nearest_in_grid(base, grid):
+    # Кольца ячеек вокруг места, пока не наберётся NEIGHBOURS кандидатов: приближённо, но без полного перебора
+    row, col = _grid_key(base.latitude, base.longitude)
+    lon_scale = max(math.cos(math.radians(base.latitude)), 0.01)
+    found = list(grid.get((row, col), ()))
+    ring = 0
+    while len(found) <= NEIGHBOURS and ring * GRID_DEG * geo.KM_PER_DEGREE * lon_scale < RADIUS_KM:
+        ring += 1
+        for y in range(col - ring, col + ring + 1):
+            found.extend(grid.get((row - ring, y), ()))
+            found.extend(grid.get((row + ring, y), ()))
+        for x in range(row - ring + 1, row + ring):
+            found.extend(grid.get((x, col - ring), ()))
+            found.extend(grid.get((x, col + ring), ()))
+
+    lat, lon = base.latitude, base.longitude
+    ordered = sorted(((other.latitude - lat) ** 2 + ((other.longitude - lon) * lon_scale) ** 2, other.id, other)
+                     for other in found)
+    return [other for _, _, other in ordered[:NEIGHBOURS + 1]]
+
+
+def _best_in_category(rows):
+    by_category = defaultdict(list)
+    for row in rows:
+        if row.category_id is not None:
+            by_category[row.category_id].append(row)
+    return {
+        category_id: heapq.nlargest(CATEGORY_CANDIDATES, members, key=lambda row: (row.discount_max or 0, row.id))
+        for category_id, members in by_category.items()
+    }
+
+
+def _cofavorite_counts():
+    by_user = defaultdict(list)
+    for user_id, location_id in db.session.query(Favorite.user_id, Favorite.location_id):
+        by_user[user_id].append(location_id)
+
+    counts = defaultdict(lambda: defaultdict(int))
+    for location_ids in by_user.values():
+        if len(location_ids) > MAX_USER_FAVORITES:
+            continue
+        for a in location_ids:
+            for b in location_ids:
+                if a != b:
+                    counts[a][b] += 1
+    return counts
+
+
+def rebuild_similar():
+    # Подборки считаются и для скрытых мест, но сами скрытые места в них не попадают
+    rows = []
+    visible = []
+    for *columns, is_stale in db.session.query(*SIMILAR_COLUMNS, Location.is_stale).filter(Location.listed()):
+        rows.append(Candidate(*columns))
+        if not is_stale:
+            visible.append(rows[-1])
+    by_id = {row.id: row for row in visible}
+    grid = defaultdict(list)
+    for row in visible:
+        if _has_point(row):
+            grid[_grid_key(row.latitude, row.longitude)].append(row)
+    best_in_category = _best_in_category(visible)
+    cofavorites = _cofavorite_counts()
+    own_scores = {row.id: own_score(row) for row in visible}
+
+    ranked = {}
+    for row in rows:
+        partners = dict(heapq.nlargest(COFAVORITE_CANDIDATES, cofavorites.get(row.id, {}).items(),
+                                       key=lambda item: item[1]))
+        candidates = {other.id: other for other in best_in_category.get(row.category_id, ())}
+        if _has_point(row):
+            candidates.update((other.id, other) for other in _nearest_in_grid(row, grid))
+        candidates.update((location_id, by_id[location_id]) for location_id in partners if location_id in by_id)
+        ranked[row.id] = top_similar(row, candidates.values(), partners, own_scores=own_scores)
+
+    db.session.query(LocationSimilar).delete(synchronize_session=False)
+    db.session.query(SimilarStale).delete(synchronize_session=False)
+    _store(ranked, replace=False)
+    db.session.commit()
+    return len(ranked)
+
+
+def _candidates_for(base, category_cache):
+    candidates = {}
+    if base.category_id is not None:
+        if base.category_id not in category_cache:
+            category_cache[base.category_id] = [
+                Candidate(*row) for row in db.session.query(*SIMILAR_COLUMNS)
+                .filter(Location.category_id == base.category_id, Location.visible())
+                .order_by(Location.discount_max.desc(), Location.id.desc()).limit(CATEGORY_CANDIDATES)
+            ]
+        candidates.update((other.id, other) for other in category_cache[base.category_id])
+    if _has_point(base):
+        nearby = [Candidate(*row) for row in db.session.query(*SIMILAR_COLUMNS).filter(
+            geo.bbox_condition(*geo.bbox_around(base.latitude, base.longitude, RADIUS_KM)), Location.visible())]
+        nearby = heapq.nsmallest(NEIGHBOURS + 1, nearby, key=lambda other: distance_km(base, other))
+        candidates.update((other.id, other) for other in nearby)
+
+    other_favorite = aliased(Favorite)
+    partners = dict(
+        db.session.query(other_favorite.location_id, db.func.count())
+        .join(Favorite, Favorite.user_id == other_favorite.user_id)
+        .filter(Favorite.location_id == base.id, other_favorite.location_id != base.id)
+        .group_by(other_favorite.location_id)
+        .order_by(db.func.count().desc()).limit(COFAVORITE_CANDIDATES)
+    )
+    missing = [location_id for location_id in partners if location_id not in candidates]
+    if missing:
+        candidates.update((row.id, Candidate(*row)) for row in db.session.query(*SIMILAR_COLUMNS).filter(
+            Location.id.in_(missing), Location.visible()))
+    return candidates.values(), partners
+
+
+# Пересчитывает устаревшие места и те, в чьих списках они стоят; возвращает id пересчитанных
+def refresh_stale(limit=500):
+    stale = [location_id for (location_id,) in
+             db.session.query(SimilarStale.location_id).order_by(SimilarStale.location_id).limit(limit)]
+    if not stale:
+        return set()
+    referrers = {location_id for (location_id,) in db.session.query(LocationSimilar.location_id)
+                 .filter(LocationSimilar.similar_id.in_(stale)).distinct()}
+    targets = set(stale) | referrers
+
+    category_cache = {}
+    ranked = {}
+    rows = db.session.query(*SIMILAR_COLUMNS).filter(Location.id.in_(list(targets)), Location.listed())
+    for base in map(Candidate._make, rows):
+        candidates, partners = _candidates_for(base, category_cache)
+        ranked[base.id] = top_similar(base, candidates, partners)
+
+    db.session.query(SimilarStale).filter(SimilarStale.location_id.in_(stale)).delete(synchronize_session=False)
+    _store(ranked)
+    db.session.commit()
+    return set(ranked)
+
+
+def similar_query(location_id, *columns, limit=TOP_K):
+    return (db.session.query(*(columns or (Location,)))
+            .join(LocationSimilar, LocationSimilar.similar_id == Location.id)
+            .filter(LocationSimilar.location_id == location_id, Location.visible())
+            .order_by(LocationSimilar.rank)
+            .limit(limit))
@@ -0,0 +1,147 @@
+import calendar
+import math
+from datetime import datetime, timedelta
+
+from models import db, Location, DiscountVote, get_meta, set_meta
+from categories import refresh_facets
+from clusters import rebuild_clusters
+from cache import cache
+
+# Актуальность скидки по голосам «действует / не действует». Голос теряет
+# половину веса за HALF_LIFE_DAYS, по взвешенным голосам считается интервал
+# Уилсона для доли «действует». Для сортировки к голосам добавляются PRIOR_WEIGHT
+# априорных голосов с долей PRIOR_SHARE, и validity_score — нижняя граница такого
+# интервала минус граница для места без голосов: у места без голосов оценка 0,
+# преобладание «не действует» опускает место ниже него, «действует» — поднимает.
+# Если же верхняя граница по одним голосам ниже STALE_THRESHOLD, место помечается
+# is_stale и пропадает из списков, карты и подборок (Location.visible).
+# Запуск по крону: flask score-validity. Пересчитываются места с голосами,
+# изменившимися после прошлого запуска, все скрытые места и места, оценка которых
+# старше RESCORE_AFTER_DAYS, — так затухание голосов доходит и до мест без новых
+# голосов. --full пересчитывает всё заново.
+HALF_LIFE_DAYS = 90
+WILSON_Z = 1.96
+STALE_THRESHOLD = 0.5
+PRIOR_WEIGHT = 4
+PRIOR_SHARE = 0.75  # большинство скидок из выгрузки действует
+# Пока взвешенных голосов меньше, место не скрывается. Скрытые места пересчитываются
+# каждый запуск: когда их голоса теряют вес, они возвращаются в списки
+MIN_STALE_WEIGHT = 3
+# За неделю вес голоса падает примерно на 5%
+RESCORE_AFTER_DAYS = 7
+CHECKPOINT_KEY = 'validity_checkpoint'
+# Голос, записанный транзакцией, которая ещё не закончилась к началу запуска, попадёт в следующий
+CHECKPOINT_OVERLAP_SECONDS = 60
+BATCH_SIZE = 500
+
+
+def decay_weight(voted_at, now):
+    if voted_at is None:
+        return 1.0
+    age_days = max((now - voted_at).total_seconds(), 0) / 86400
+    return 0.5 ** (age_days / HALF_LIFE_DAYS)
+
+
+def wilson_bounds(positive, total, z=WILSON_Z):
+    if total <= 0:
+        return 0.0, 1.0
+    share = positive / total
+    denominator = 1 + z * z / total
+    centre = share + z * z / (2 * total)
+    margin = z * math.sqrt(share * (1 - share) / total + z * z / (4 * total * total))
+    return max(0.0, (centre - margin) / denominator), min(1.0, (centre + margin) / denominator)
+
+
+def _smoothed_lower(positive, total):
+    return wilson_bounds(positive + PRIOR_WEIGHT * PRIOR_SHARE, total + PRIOR_WEIGHT)[0]
+
+
+NEUTRAL_LOWER = _smoothed_lower(0, 0)
+
+
+# votes — пары (is_valid, время голоса); возвращает (validity_score, is_stale)
+def validity(votes, now):
+    positive = total = 0.0
+    for is_valid, voted_at in votes:
+        weight = decay_weight(voted_at, now)
+        total += weight
+        if is_valid:
+            positive += weight
+    if total <= 0:
+        return 0.0, False
+    _, upper = wilson_bounds(positive, total)
+    score = round(_smoothed_lower(positive, total) - NEUTRAL_LOWER, 6)
+    return score, total >= MIN_STALE_WEIGHT and upper < STALE_THRESHOLD
+
+
+def _to_timestamp(moment):
+    return calendar.timegm(moment.utctimetuple())
+
+
+def _targets(full, checkpoint, started):
+    if full:
+        voted = {location_id for (location_id,) in db.session.query(DiscountVote.location_id).distinct()}
+        scored = {location_id for (location_id,) in db.session.query(Location.id).filter(
+            db.or_(Location.validity_score != 0, Location.is_stale.is_(True), Location.validity_scored_at.isnot(None)))}
+        return sorted(voted | scored)
+    since = datetime.utcfromtimestamp(checkpoint)
+    # Без DISTINCT: так запрос идёт по индексу (updated_at, location_id), повторы убирает множество
+    targets = {location_id for (location_id,) in
+               db.session.query(DiscountVote.location_id).filter(DiscountVote.updated_at >= since)}
+    # Отдельными запросами, чтобы каждый шёл по своему индексу
+    targets.update(location_id for (location_id,) in
+                   db.session.query(Location.id).filter(Location.is_stale.is_(True)))
+    targets.update(location_id for (location_id,) in db.session.query(Location.id).filter(
+        Location.validity_scored_at < started - timedelta(days=RESCORE_AFTER_DAYS)))
+    return sorted(targets)
+
+
+def score_locations(full=False, batch_size=BATCH_SIZE):
+    started = datetime.utcnow()
+    checkpoint = get_meta(CHECKPOINT_KEY, None)
+    full = full or checkpoint is None
+    targets = _targets(full, checkpoint, started)
+
+    changed = 0
+    flipped_categories = set()
+    any_flipped = False
+    for start in range(0, len(targets), batch_size):
+        ids = targets[start:start + batch_size]
+        votes = {location_id: [] for location_id in ids}
+        for location_id, is_valid, updated_at, created_at in db.session.query(
+            DiscountVote.location_id, DiscountVote.is_valid, DiscountVote.updated_at, DiscountVote.created_at
+        ).filter(DiscountVote.location_id.in_(ids)):
+            votes[location_id].append((is_valid, updated_at or created_at))
+
+        # Время оценки записывается всем проверенным местам, даже если оценка не изменилась
+        updates = []
+        for location_id, score, stale, category_id in db.session.query(
+            Location.id, Location.validity_score, Location.is_stale, Location.category_id
+        ).filter(Location.id.in_(ids)):
+            new_score, new_stale = validity(votes[location_id], started)
+            updates.append({'location_id': location_id, 'score': new_score, 'stale': new_stale})
+            if (new_score, new_stale) == (score, bool(stale)):
+                continue
+            changed += 1
+            if new_stale != bool(stale):
+                any_flipped = True
+                flipped_categories.add(category_id)
+
+        if updates:
+            db.session.execute(
+                Location.__table__.update()
+                .where(Location.__table__.c.id == db.bindparam('location_id'))
+                .values(validity_score=db.bindparam('score'), is_stale=db.bindparam('stale'),
+                        validity_scored_at=started),
+                updates,
+            )
+            db.session.commit()
+
+    # Скрытые и вернувшиеся места меняют фасеты и кластеры карты, новые оценки — порядок списков
+    if any_flipped:
+        refresh_facets(flipped_categories)
+        rebuild_clusters()
+    if changed:
+        cache.bump_data_version()
+    set_meta(CHECKPOINT_KEY, _to_timestamp(started) - CHECKPOINT_OVERLAP_SECONDS)
+    return len(targets), changed
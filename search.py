@@ -0,0 +1,196 @@
+import re
+from functools import lru_cache
+
+from sqlalchemy import select, union_all, literal, func
+
+from models import db, Location, SearchTerm
+
+NAME_WEIGHT = 3
+ADDRESS_WEIGHT = 1
+MAX_QUERY_TOKENS = 6
+MAX_TERM_LENGTH = 64
+# Более короткий префикс захватывает заметную часть индекса, такие слова ищутся целиком
+MIN_PREFIX_LENGTH = 3
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания из алгоритма Snowball для русского языка.
+# Первая группа допустима только после «а» или «я».
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                  'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+         'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+             'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю',
+             'ия', 'ья', 'я'))
+SUPERLATIVE = ((), ('ейше', 'ейш'))
+DERIVATIONAL = ((), ('ость', 'ост'))
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, groups):
+    after_a, plain = groups
+    best = None
+    for suffix in after_a:
+        pos = len(word) - len(suffix)
+        if pos - 1 >= start and word.endswith(suffix) and word[pos - 1] in 'ая':
+            if best is None or len(suffix) > len(word) - best:
+                best = pos
+    for suffix in plain:
+        pos = len(word) - len(suffix)
+        if pos >= start and word.endswith(suffix):
+            if best is None or len(suffix) > len(word) - best:
+                best = pos
+    if best is None:
+        return word, False
+    return word[:best], True
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    if len(word) < 3 or not any(ch in VOWELS for ch in word):
+        return word
+    rv, r2 = _regions(word)
+
+    word, found = _strip(word, rv, PERFECTIVE_GERUND)
+    if not found:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        word, found = _strip(word, rv, ADJECTIVE)
+        if found:
+            word, _ = _strip(word, rv, PARTICIPLE)
+        else:
+            word, found = _strip(word, rv, VERB)
+            if not found:
+                word, _ = _strip(word, rv, NOUN)
+
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    word, _ = _strip(word, r2, DERIVATIONAL)
+
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        word, found = _strip(word, rv, SUPERLATIVE)
+        if found and word.endswith('нн'):
+            word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(token)[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(normalize(text))]
+
+
+def terms_for(name, address):
+    weights = {}
+    for term in tokenize(address):
+        weights[term] = max(weights.get(term, 0), ADDRESS_WEIGHT)
+    for term in tokenize(name):
+        weights[term] = NAME_WEIGHT + (1 if weights.get(term) else 0)
+    return weights
+
+
+def index_rows(rows):
+    rows = list(rows)
+    if not rows:
+        return 0
+    ids = [location_id for location_id, _, _ in rows]
+    db.session.query(SearchTerm).filter(SearchTerm.location_id.in_(ids)).delete(synchronize_session=False)
+    terms = [
+        {'term': term, 'location_id': location_id, 'weight': weight}
+        for location_id, name, address in rows
+        for term, weight in terms_for(name, address).items()
+    ]
+    if terms:
+        db.session.execute(SearchTerm.__table__.insert(), terms)
+    return len(terms)
+
+
+def index_locations(location_ids, batch_size=500):
+    location_ids = list(location_ids)
+    indexed = 0
+    for start in range(0, len(location_ids), batch_size):
+        chunk = location_ids[start:start + batch_size]
+        rows = db.session.query(Location.id, Location.name, Location.address).filter(Location.id.in_(chunk)).all()
+        indexed += index_rows(rows)
+        db.session.commit()
+    return indexed
+
+
+def remove_from_index(location_ids, batch_size=500):
+    location_ids = list(location_ids)
+    for start in range(0, len(location_ids), batch_size):
+        chunk = location_ids[start:start + batch_size]
+        db.session.query(SearchTerm).filter(SearchTerm.location_id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def reindex_all(batch_size=500):
+    db.session.query(SearchTerm).delete(synchronize_session=False)
+    db.session.commit()
+    last_id = 0
+    indexed = 0
+    while True:
+        rows = (db.session.query(Location.id, Location.name, Location.address)
+                .filter(Location.id > last_id, Location.listed()).order_by(Location.id).limit(batch_size).all())
+        if not rows:
+            break
+        indexed += index_rows(rows)
+        db.session.commit()
+        last_id = rows[-1][0]
+    return indexed
+
+
+# Подзапрос (location_id, score): места, где нашлись все слова запроса.
+# Последнее слово ищется по префиксу, чтобы поиск работал при наборе, если в нём
+# не меньше MIN_PREFIX_LENGTH букв.
+def search_subquery(query_text):
+    tokens = list(dict.fromkeys(tokenize(query_text)))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+
+    selects = []
+    for position, term in enumerate(tokens):
+        condition = SearchTerm.term == term
+        if position == len(tokens) - 1 and len(term) >= MIN_PREFIX_LENGTH:
+            # префикс как диапазон: так индекс используется и в MySQL, и в SQLite
+            condition = db.and_(SearchTerm.term >= term, SearchTerm.term < term + '\uffff')
+        selects.append(
+            select(SearchTerm.location_id, literal(position).label('token'), SearchTerm.weight)
+            .where(condition)
+        )
+    matches = union_all(*selects).subquery()
+
+    return (
+        select(matches.c.location_id, func.sum(matches.c.weight).label('score'))
+        .group_by(matches.c.location_id)
+        .having(func.count(func.distinct(matches.c.token)) == len(tokens))
+        .subquery()
+    )
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import event
+
+import migrations
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "test.db"}')
+    monkeypatch.setenv('CACHE_BACKEND', 'memory')
+    monkeypatch.delenv('WRITE_BEHIND', raising=False)
+    monkeypatch.delenv('AUTO_MIGRATE', raising=False)
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        migrations.upgrade()
+    yield app
+
+
+@pytest.fixture
+def statements(app):
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', count)
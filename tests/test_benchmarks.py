@@ -0,0 +1,114 @@
+import contextlib
+import io
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import migrations
+from bench.generate import generate_items, write_data_file
+from data_loader import load_data_from_json, sync_data_from_json
+from geo import cell_for
+from models import db, Location, format_discount, average_rating
+from normalize import normalize_item, parse_discount_text, content_hash
+from search import stem, terms_for
+
+# Бенчмарки импорта и вспомогательных функций на pytest-benchmark (в requirements не входит):
+#   pip install pytest-benchmark
+#   python -m pytest tests/test_benchmarks.py --benchmark-json=bench/results/before.json
+#   pytest-benchmark compare bench/results/before.json bench/results/after.json
+# Без плагина файл пропускается. Замеры маршрутов — в bench/scenarios.py.
+
+IMPORT_ROWS = 1000
+
+ITEMS = generate_items(1000, seed=7)
+ROWS = [row for row in map(normalize_item, ITEMS) if row]
+WORDS = [word for row in ROWS for word in (row['name'] + ' ' + row['address']).lower().split()]
+
+
+def _quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_normalize_item(benchmark):
+    benchmark(lambda: [normalize_item(item) for item in ITEMS])
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_content_hash(benchmark):
+    benchmark(lambda: [content_hash(row) for row in ROWS])
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_parse_discount_text(benchmark):
+    assert benchmark(parse_discount_text, 'от 5 до 15% по социальной карте') == (5, 15)
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_format_discount(benchmark):
+    assert benchmark(format_discount, 5.0, 15.0, None) == '5-15%'
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_average_rating(benchmark):
+    assert benchmark(average_rating, 11, 3) == 3.7
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_location_discount_display(benchmark):
+    location = Location(name='Аптека', address='Москва', discount_min=5, discount_max=15)
+    assert benchmark(location.get_discount_display) == '5-15%'
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_stem_cold_cache(benchmark):
+    def run():
+        stem.cache_clear()
+        for word in WORDS:
+            stem(word)
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_terms_for(benchmark):
+    benchmark(lambda: [terms_for(row['name'], row['address']) for row in ROWS])
+
+
+@pytest.mark.benchmark(group='helpers')
+def test_cell_for(benchmark):
+    assert benchmark(cell_for, 55.75, 37.61) is not None
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    return write_data_file(str(tmp_path / 'data.json'), IMPORT_ROWS)
+
+
+@pytest.mark.benchmark(group='import')
+def test_load_data_from_json(benchmark, app, data_file):
+    def fresh_database():
+        with app.app_context():
+            db.drop_all()
+            _quiet(migrations.upgrade)
+
+    def load():
+        with app.app_context():
+            _quiet(load_data_from_json, data_file)
+
+    benchmark.pedantic(load, setup=fresh_database, rounds=3)
+    with app.app_context():
+        assert Location.query.count() > 0
+
+
+@pytest.mark.benchmark(group='import')
+def test_sync_unchanged(benchmark, app, data_file):
+    with app.app_context():
+        _quiet(load_data_from_json, data_file)
+
+    def sync():
+        with app.app_context():
+            _quiet(sync_data_from_json, data_file, force=True)
+
+    benchmark.pedantic(sync, rounds=3)
@@ -0,0 +1,51 @@
+import base64
+import json
+
+import pytest
+
+from models import db, Location
+from pagination import decode_cursor, encode_cursor
+
+MALFORMED = [
+    'W3t9LCAxXQ==',  # [{}, 1]
+    'W1sxXSwgMV0=',  # [[1], 1]
+    encode_cursor(['много', 1]),
+    encode_cursor([1, 2, 3, 4, 5, 6]),
+    encode_cursor({'id': 1}),
+    'не base64',
+]
+
+
+def _raw(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def test_decode_cursor_accepts_scalars():
+    assert decode_cursor(encode_cursor([1.5, None, 'a', True]), 4) == [1.5, None, 'a', True]
+
+
+@pytest.mark.parametrize('values', [[{}, 1], [[1], 1], {'id': 1}, 'строка'])
+def test_decode_cursor_rejects_non_scalars(values):
+    assert decode_cursor(_raw(values)) is None
+
+
+def test_decode_cursor_rejects_long_cursor():
+    assert decode_cursor(encode_cursor([1, 2, 3]), 2) is None
+
+
+@pytest.fixture
+def listed(app):
+    with app.app_context():
+        db.session.add_all([
+            Location(name=f'Место {number}', address=f'ул. Тверская, {number}', discount_min=number, discount_max=number)
+            for number in range(1, 6)
+        ])
+        db.session.commit()
+
+
+@pytest.mark.parametrize('cursor', MALFORMED)
+@pytest.mark.parametrize('path', ['/', '/api/locations', '/api/v1/locations', '/api/v1/locations?sort=discount'])
+def test_malformed_cursor_is_ignored(app, listed, path, cursor):
+    separator = '&' if '?' in path else '?'
+    response = app.test_client().get(f'{path}{separator}after={cursor}')
+    assert response.status_code == 200
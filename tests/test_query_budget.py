@@ -0,0 +1,46 @@
+import pytest
+
+from models import db, User, Location, Review, Favorite, LocationSimilar
+
+# Страница места: место с избранным и голосом, отзывы, похожие места.
+# Анонимному запросу к ним добавляется проверка версии данных для ключа кэша
+DETAIL_STATEMENTS = 3
+VERSION_CHECK = 1
+
+
+@pytest.fixture
+def ids(app):
+    with app.app_context():
+        user = User(username='student', email='student@example.com', password='x')
+        place = Location(name='Кафе', address='ул. Тверская, 1', category='Кафе',
+                         discount_min=10, discount_max=10, latitude=55.76, longitude=37.61)
+        other = Location(name='Музей', address='ул. Тверская, 3', category='Музей',
+                         discount_min=50, discount_max=50, latitude=55.761, longitude=37.611)
+        db.session.add_all([user, place, other])
+        db.session.flush()
+        db.session.add_all([
+            Review(user_id=user.id, location_id=place.id, text='Хорошо', rating=5),
+            Favorite(user_id=user.id, location_id=place.id),
+            LocationSimilar(location_id=place.id, rank=1, similar_id=other.id, score=1.0),
+        ])
+        db.session.commit()
+        return {'user': user.id, 'location': place.id}
+
+
+def test_location_detail_anonymous(app, ids, statements):
+    client = app.test_client()
+    response = client.get(f'/location/{ids["location"]}')
+    assert response.status_code == 200
+    assert len(statements) <= DETAIL_STATEMENTS + VERSION_CHECK, statements
+
+
+def test_location_detail_logged_in(app, ids, statements):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = ids['user']
+        session['username'] = 'student'
+    response = client.get(f'/location/{ids["location"]}')
+    assert response.status_code == 200
+    assert 'Музей' in response.get_data(as_text=True)
+    # Вошедшему пользователю страница не кэшируется, версия данных не проверяется
+    assert len(statements) <= DETAIL_STATEMENTS, statements
@@ -0,0 +1,33 @@
+import pytest
+
+from models import db, User, Location, Review
+
+
+@pytest.fixture
+def client(app):
+    with app.app_context():
+        user = User(username='student', email='student@example.com', password='x')
+        location = Location(name='Кафе', address='ул. Тверская, 1')
+        db.session.add_all([user, location])
+        db.session.commit()
+        user_id, location_id = user.id, location.id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = 'student'
+    client.location_id = location_id
+    return client
+
+
+def test_non_numeric_rating_is_rejected_before_queueing(app, client):
+    response = client.post(f'/add_review/{client.location_id}', data={'text': 'Хорошо', 'rating': 'пять'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert Review.query.count() == 0
+
+
+def test_review_is_saved(app, client):
+    response = client.post(f'/add_review/{client.location_id}', data={'text': 'Хорошо', 'rating': '4'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert [review.rating for review in Review.query] == [4]
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import scoring
+from models import db, User, Location, DiscountVote
+
+
+def test_mostly_negative_votes_score_below_unvoted():
+    now = datetime.utcnow()
+    assert scoring.validity([], now) == (0.0, False)
+    score, stale = scoring.validity([(True, now)] + [(False, now)] * 4, now)
+    assert score < 0 and not stale
+    assert scoring.validity([(True, now)] * 3, now)[0] > 0
+
+
+def test_mostly_negative_location_ranks_below_unvoted(app):
+    with app.app_context():
+        users = [User(username=f'u{number}', email=f'u{number}@example.com', password='x') for number in range(5)]
+        unvoted = Location(name='Без голосов', address='ул. Арбат, 1')
+        disputed = Location(name='Спорная', address='ул. Арбат, 2')
+        db.session.add_all(users + [unvoted, disputed])
+        db.session.flush()
+        db.session.add_all(
+            DiscountVote(user_id=user.id, location_id=disputed.id, is_valid=number == 0)
+            for number, user in enumerate(users)
+        )
+        db.session.commit()
+        scoring.score_locations(full=True)
+        order = [unvoted.id, disputed.id]
+
+    items = app.test_client().get('/api/v1/locations').get_json()['items']
+    assert [item['id'] for item in items] == order
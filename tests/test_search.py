@@ -0,0 +1,30 @@
+import pytest
+
+from models import db, Location
+from search import reindex_all, search_subquery
+
+
+@pytest.fixture
+def indexed(app):
+    with app.app_context():
+        db.session.add_all([
+            Location(name='Аптека', address='ул. Арбат, 1'),
+            Location(name='Ап', address='ул. Арбат, 2'),
+        ])
+        db.session.commit()
+        reindex_all()
+
+
+def _found(app, query_text):
+    with app.app_context():
+        subquery = search_subquery(query_text)
+        return sorted(name for (name,) in db.session.query(Location.name)
+                      .join(subquery, subquery.c.location_id == Location.id))
+
+
+def test_short_last_word_matches_whole_terms_only(app, indexed):
+    assert _found(app, 'ап') == ['Ап']
+
+
+def test_last_word_is_prefix_from_three_letters(app, indexed):
+    assert _found(app, 'апт') == ['Аптека']
@@ -0,0 +1,443 @@
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, abort
+from sqlalchemy.orm import joinedload
+from werkzeug.security import generate_password_hash, check_password_hash
+import click
+from types import SimpleNamespace
+
+from models import db, User, Location, Review, Favorite, DiscountVote, average_rating, reconcile_location_stats
+from pagination import keyset_page, page_size_from
+from search import reindex_all
+import geo
+import clusters
+from cache import cache, location_tag
+import migrations
+import query_plans
+from categories import category_choices, facets_payload
+from listing import float_arg, listing_sort, location_listing, listing_cache_key
+from write_queue import write_queue, REVIEW, VOTE, FAVORITE
+from recommendations import rebuild_similar, refresh_stale, similar_query
+from scoring import score_locations
+
+# Страницы сайта и команды flask; cli_group=None оставляет команды на верхнем уровне
+main = Blueprint('main', __name__, cli_group=None)
+
+REVIEWS_PER_PAGE = 20
+SIMILAR_LIMIT = 3
+
+@main.cli.command('db-upgrade')
+def db_upgrade_command():
+    migrations.upgrade()
+
+@main.cli.command('db-status')
+def db_status_command():
+    for version, name, applied in migrations.status():
+        print(f"{'✓' if applied else ' '} {version:>3} {name}")
+
+@main.cli.command('explain-check')
+@click.option('--verbose', is_flag=True, help='Показать план каждого запроса')
+def explain_check_command(verbose):
+    failures = query_plans.check_query_plans(verbose)
+    if failures:
+        raise SystemExit(1)
+
+@main.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    fixed = reconcile_location_stats()
+    print(f"✓ Пересчитаны агрегаты, исправлено мест: {fixed}")
+
+@main.cli.command('reindex-search')
+def reindex_search_command():
+    indexed = reindex_all()
+    print(f"✓ Поисковый индекс перестроен, терминов: {indexed}")
+
+@main.cli.command('drain-writes')
+def drain_writes_command():
+    applied = write_queue.drain()
+    print(f"✓ Применено отложенных изменений: {applied}")
+
+@main.cli.command('rebuild-clusters')
+def rebuild_clusters_command():
+    created = clusters.rebuild_clusters()
+    print(f"✓ Кластеры карты пересчитаны: {created}")
+
+# Без WRITE_BEHIND устаревшие похожие места пересчитывает только эта команда, её стоит запускать по крону
+@main.cli.command('refresh-similar')
+@click.option('--all', 'rebuild', is_flag=True, help='Пересчитать все места, а не только устаревшие')
+def refresh_similar_command(rebuild):
+    if rebuild:
+        print(f"✓ Похожие места пересчитаны для {rebuild_similar()} мест")
+        return
+    refreshed = refresh_stale(limit=None)
+    cache.evict_locations(refreshed)
+    print(f"✓ Обновлены похожие места для {len(refreshed)} мест")
+
+@main.cli.command('score-validity')
+@click.option('--full', is_flag=True, help='Пересчитать все места с голосами, а не только с новыми')
+def score_validity_command(full):
+    scored, changed = score_locations(full=full)
+    print(f"✓ Проверено мест: {scored}, изменилась оценка: {changed}")
+
+def _location_to_dict(location):
+    return {
+        'id': location.id,
+        'name': location.name,
+        'address': location.address,
+        'category': location.category or '',
+        'category_id': location.category_id,
+        'discount': location.get_discount_display(),
+        'discount_min': location.discount_min,
+        'discount_max': location.discount_max,
+        'lat': location.latitude,
+        'lon': location.longitude,
+        'rating': location.get_average_rating(),
+        'reviews_count': location.get_reviews_count(),
+    }
+
+# Анонимные страницы без flash-сообщений одинаковы для всех, их можно кэшировать
+def _cacheable():
+    return 'user_id' not in session and '_flashes' not in session
+
+@main.route('/')
+def index():
+    category = request.args.get('category', '')
+    search_query = request.args.get('search', '')
+
+    cacheable = _cacheable()
+    if cacheable:
+        cache_key = listing_cache_key('index', request.args)
+        html = cache.get(cache_key)
+        if html is not None:
+            return html
+    
+    locations, next_cursor, total, total_exact = location_listing(request.args)
+    
+    categories = category_choices()
+
+    html = render_template('index.html', locations=locations, categories=categories, current_category=category, search_query=search_query,
+                           discount_from=request.args.get('discount_from', ''),
+                           discount_to=request.args.get('discount_to', ''),
+                           current_sort=listing_sort(request.args),
+                           next_cursor=next_cursor, total=total, total_exact=total_exact)
+    if cacheable:
+        cache.set(cache_key, html, tags=[location_tag(loc.id) for loc in locations])
+    return html
+
+@main.route('/api/locations')
+def api_locations():
+    cache_key = listing_cache_key('api_locations', request.args)
+    payload = cache.get(cache_key)
+    if payload is None:
+        locations, next_cursor, total, total_exact = location_listing(request.args)
+        payload = {
+            'items': [_location_to_dict(loc) for loc in locations],
+            'next_cursor': next_cursor,
+            'approx_total': total,
+            'total_is_exact': total_exact,
+        }
+        cache.set(cache_key, payload, tags=[location_tag(loc.id) for loc in locations])
+    return jsonify(payload)
+
+@main.route('/api/categories')
+def api_categories():
+    cache_key = cache.page_key('api_categories')
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = {'items': facets_payload()}
+        cache.set(cache_key, payload)
+    return jsonify(payload)
+
+@main.route('/api/cache/stats')
+def api_cache_stats():
+    return jsonify(cache.stats())
+
+def _bbox_arg(args):
+    try:
+        south, west, north, east = [float(part) for part in args.get('bbox', '').split(',')]
+    except ValueError:
+        return None
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    return south, west, north, east
+
+@main.route('/api/locations/nearby')
+def api_locations_nearby():
+    limit = page_size_from(request.args.get('limit'))
+
+    if request.args.get('bbox'):
+        bbox = _bbox_arg(request.args)
+        if bbox is None:
+            return jsonify({'error': 'Некорректный bbox, ожидается south,west,north,east'}), 400
+        locations = geo.within_bbox(*bbox, limit=limit)
+        return jsonify({'items': [_location_to_dict(loc) for loc in locations]})
+
+    lat = float_arg(request.args, 'lat')
+    lon = float_arg(request.args, 'lon')
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'Укажите координаты lat и lon'}), 400
+
+    if request.args.get('radius'):
+        radius = float_arg(request.args, 'radius')
+        if radius is None or radius <= 0:
+            return jsonify({'error': 'Некорректный радиус'}), 400
+        found = geo.within_radius(lat, lon, min(radius, geo.MAX_RADIUS_KM), limit)
+    else:
+        found = geo.nearest(lat, lon, limit)
+
+    items = []
+    for distance, location in found:
+        item = _location_to_dict(location)
+        item['distance_km'] = round(distance, 3)
+        items.append(item)
+    return jsonify({'items': items})
+
+@main.route('/map')
+def map_view():
+    cacheable = _cacheable()
+    if cacheable:
+        cache_key = cache.page_key('map')
+        html = cache.get(cache_key)
+        if html is not None:
+            return html
+
+    html = render_template(
+        'map.html',
+        total_points=clusters.total_points(),
+        yandex_maps_api_key=current_app.config.get('YANDEX_MAPS_API_KEY', '')
+    )
+    if cacheable:
+        cache.set(cache_key, html)
+    return html
+
+@main.route('/api/map/clusters')
+def api_map_clusters():
+    bbox = _bbox_arg(request.args)
+    if bbox is None:
+        return jsonify({'error': 'Некорректный bbox, ожидается south,west,north,east'}), 400
+    try:
+        zoom = int(request.args.get('zoom', ''))
+    except ValueError:
+        return jsonify({'error': 'Некорректный zoom'}), 400
+
+    return jsonify({'items': clusters.clusters_in_bbox(*bbox, zoom=zoom)})
+
+@main.route('/location/<int:location_id>')
+def location_detail(location_id):
+    cacheable = _cacheable()
+    if cacheable:
+        cache_key = cache.page_key('location_detail', location_id=location_id,
+                                   reviews_after=request.args.get('reviews_after', ''))
+        html = cache.get(cache_key)
+        if html is not None:
+            return html
+
+    # Место вместе с избранным и голосом пользователя одним запросом
+    query = db.session.query(Location, Favorite.id, DiscountVote.is_valid).filter(
+        Location.id == location_id, Location.listed()
+    )
+    user_id = session.get('user_id')
+    query = query.outerjoin(Favorite, db.and_(Favorite.location_id == Location.id, Favorite.user_id == user_id))
+    query = query.outerjoin(DiscountVote, db.and_(DiscountVote.location_id == Location.id, DiscountVote.user_id == user_id))
+    row = query.first()
+    if row is None:
+        abort(404)
+    location, favorite_id, user_vote = row
+    is_favorite = favorite_id is not None
+
+    reviews, next_reviews_cursor = keyset_page(
+        Review.query.options(joinedload(Review.user)).filter(Review.location_id == location_id),
+        [(Review.created_at, True), (Review.id, True)],
+        request.args.get('reviews_after'),
+        REVIEWS_PER_PAGE,
+    )
+    
+    reviews_count = location.get_reviews_count()
+    avg_rating = location.get_average_rating()
+    valid_votes, invalid_votes = location.valid_votes, location.invalid_votes
+
+    pending = write_queue.pending(user_id, location_id) if user_id else None
+    if pending:
+        is_favorite = pending.favorites.get(location_id, is_favorite)
+        vote = pending.votes.get(location_id)
+        if vote is not None and vote != user_vote:
+            valid_votes += (1 if vote else 0) - (1 if user_vote is True else 0)
+            invalid_votes += (0 if vote else 1) - (1 if user_vote is False else 0)
+            user_vote = vote
+        if pending.reviews:
+            reviews_count += len(pending.reviews)
+            avg_rating = average_rating(location.rating_sum + sum(m.payload['rating'] for m in pending.reviews),
+                                        reviews_count)
+            if not request.args.get('reviews_after'):
+                author = SimpleNamespace(username=session.get('username'))
+                reviews = [
+                    SimpleNamespace(user=author, created_at=m.created_at, **m.payload)
+                    for m in reversed(pending.reviews)
+                ] + reviews
+
+    similar_locations = similar_query(location_id, limit=SIMILAR_LIMIT).all()
+
+    html = render_template('location_detail.html',
+                         location=location,
+                         reviews=reviews,
+                         next_reviews_cursor=next_reviews_cursor,
+                         reviews_count=reviews_count,
+                         avg_rating=avg_rating,
+                         similar_locations=similar_locations,
+                         is_favorite=is_favorite,
+                         valid_votes=valid_votes,
+                         invalid_votes=invalid_votes,
+                         user_vote=user_vote)
+    if cacheable:
+        cache.set(cache_key, html, tags=[location_tag(location_id)])
+    return html
+
+
+@main.route('/vote_discount/<int:location_id>', methods=['POST'])
+def vote_discount(location_id):
+    if 'user_id' not in session:
+        flash('Необходимо войти в систему', 'warning')
+        return redirect(url_for('main.login'))
+
+    location = Location.query.get_or_404(location_id)
+    is_valid_str = request.form.get('is_valid', '1')
+    is_valid = is_valid_str == '1'
+
+    write_queue.submit(VOTE, session['user_id'], location_id, is_valid=is_valid)
+    flash('Спасибо за ваш ответ!', 'success')
+    return redirect(url_for('main.location_detail', location_id=location.id))
+
+@main.route('/add_review/<int:location_id>', methods=['POST'])
+def add_review(location_id):
+    if 'user_id' not in session:
+        flash('Необходимо войти в систему', 'warning')
+        return redirect(url_for('main.login'))
+    
+    text = request.form.get('text', '').strip()
+    try:
+        rating = int(request.form.get('rating', 5))
+    except ValueError:
+        flash('Оценка должна быть числом от 1 до 5', 'danger')
+        return redirect(url_for('main.location_detail', location_id=location_id))
+    
+    if not text:
+        flash('Отзыв не может быть пустым', 'danger')
+        return redirect(url_for('main.location_detail', location_id=location_id))
+    
+    if rating < 1 or rating > 5:
+        rating = 5
+    
+    Location.query.get_or_404(location_id)
+    write_queue.submit(REVIEW, session['user_id'], location_id, text=text, rating=rating)
+    
+    flash('Отзыв успешно добавлен!', 'success')
+    return redirect(url_for('main.location_detail', location_id=location_id))
+
+@main.route('/toggle_favorite/<int:location_id>', methods=['POST'])
+def toggle_favorite(location_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Необходимо войти в систему'}), 401
+    
+    Location.query.get_or_404(location_id)
+
+    # Клиент присылает нужное состояние: повторные и параллельные запросы не конфликтуют
+    user_id = session['user_id']
+    state = (request.get_json(silent=True) or {}).get('state')
+    if not isinstance(state, bool):
+        state = write_queue.pending(user_id, location_id).favorites.get(location_id)
+        if state is None:
+            state = Favorite.query.filter_by(user_id=user_id, location_id=location_id).first() is not None
+        state = not state
+
+    write_queue.submit(FAVORITE, user_id, location_id, state=state)
+    if state:
+        return jsonify({'status': 'added', 'message': 'Добавлено в избранное'})
+    return jsonify({'status': 'removed', 'message': 'Удалено из избранного'})
+
+@main.route('/favorites')
+def favorites():
+    if 'user_id' not in session:
+        flash('Необходимо войти в систему', 'warning')
+        return redirect(url_for('main.login'))
+    
+    favorites = Favorite.query.filter_by(user_id=session['user_id']).all()
+    location_ids = {f.location_id for f in favorites}
+    for location_id, state in write_queue.pending(session['user_id']).favorites.items():
+        if state:
+            location_ids.add(location_id)
+        else:
+            location_ids.discard(location_id)
+    locations = Location.query.filter(Location.id.in_(location_ids), Location.listed()).all()
+    
+    return render_template('favorites.html', locations=locations)
+
+@main.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        email = request.form.get('email', '').strip()
+        password = request.form.get('password', '')
+        
+        if not username or not email or not password:
+            flash('Все поля обязательны для заполнения', 'danger')
+            return render_template('register.html')
+        
+        if User.query.filter_by(username=username).first():
+            flash('Пользователь с таким именем уже существует', 'danger')
+            return render_template('register.html')
+        
+        if User.query.filter_by(email=email).first():
+            flash('Пользователь с таким email уже существует', 'danger')
+            return render_template('register.html')
+        
+        user = User(username=username, email=email, password=generate_password_hash(password))
+        
+        db.session.add(user)
+        db.session.commit()
+        
+        flash('Регистрация успешна! Войдите в систему', 'success')
+        return redirect(url_for('main.login'))
+    
+    return render_template('register.html')
+
+@main.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        
+        user = User.query.filter_by(username=username).first()
+        
+        if user and check_password_hash(user.password, password):
+            session['user_id'] = user.id
+            session['username'] = user.username
+            flash(f'Добро пожаловать, {user.username}!', 'success')
+            return redirect(url_for('main.index'))
+        else:
+            flash('Неверное имя пользователя или пароль', 'danger')
+    
+    return render_template('login.html')
+
+@main.route('/logout')
+def logout():
+    session.clear()
+    flash('Вы вышли из системы', 'info')
+    return redirect(url_for('main.index'))
+
+@main.route('/profile')
+def profile():
+    if 'user_id' not in session:
+        flash('Необходимо войти в систему', 'warning')
+        return redirect(url_for('main.login'))
+    
+    user = User.query.get(session['user_id'])
+    reviews_count = Review.query.filter_by(user_id=user.id).count()
+    favorites_count = Favorite.query.filter_by(user_id=user.id).count()
+
+    pending = write_queue.pending(user.id)
+    if pending:
+        reviews_count += len(pending.reviews)
+        stored = {location_id for (location_id,) in db.session.query(Favorite.location_id).filter(
+            Favorite.user_id == user.id, Favorite.location_id.in_(list(pending.favorites)))}
+        favorites_count += sum(1 for location_id, state in pending.favorites.items() if state and location_id not in stored)
+        favorites_count -= sum(1 for location_id, state in pending.favorites.items() if not state and location_id in stored)
+    
+    return render_template('profile.html', user=user, reviews_count=reviews_count, favorites_count=favorites_count)
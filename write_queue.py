@@ -0,0 +1,377 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import db, Location, Review, Favorite, DiscountVote, SimilarStale
+from cache import cache
+from recommendations import refresh_stale
+
+logger = logging.getLogger(__name__)
+
+# Отложенная запись отзывов, голосов и избранного. Запрос проверяет данные,
+# кладёт изменение в локальную очередь SQLite и сразу отвечает; фоновый поток
+# применяет очередь пачками в одной транзакции через upsert. Без WRITE_BEHIND
+# те же изменения применяются сразу, по одному на запрос.
+REVIEW = 'review'
+VOTE = 'vote'
+FAVORITE = 'favorite'
+
+# Пока поток держит аренду, остальные процессы очередь не разбирают:
+# так изменения одного пользователя применяются строго по порядку
+LEASE_SECONDS = 30
+
+Mutation = namedtuple('Mutation', 'id kind user_id location_id payload created_at')
+
+# Ошибки в самих данных: такое изменение не применится и при повторе, его можно
+# отбросить. Остальные (база недоступна, нет таблицы) останавливают разбор,
+# изменения остаются в очереди до следующей попытки
+DATA_ERRORS = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS mutations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        location_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_mutations_user ON mutations (user_id, location_id)',
+    '''CREATE TABLE IF NOT EXISTS lease (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+)
+
+
+def _insert(table):
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f'Upsert для {dialect} не поддерживается')
+    return insert(table)
+
+
+def _upsert(table, rows, keys, update=()):
+    statement = _insert(table)
+    if db.engine.dialect.name == 'mysql':
+        columns = update or keys[:1]
+        statement = statement.on_duplicate_key_update({name: statement.inserted[name] for name in columns})
+    elif update:
+        statement = statement.on_conflict_do_update(index_elements=keys,
+                                                    set_={name: statement.excluded[name] for name in update})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=keys)
+    db.session.execute(statement, rows)
+
+
+def _latest(mutations):
+    # Для голосов и избранного важно только последнее состояние пары пользователь–место
+    latest = {}
+    for mutation in mutations:
+        latest[(mutation.user_id, mutation.location_id)] = mutation
+    return latest
+
+
+def _apply_favorites(mutations):
+    latest = _latest(mutations)
+    added = [{'user_id': user_id, 'location_id': location_id}
+             for (user_id, location_id), mutation in latest.items() if mutation.payload['state']]
+    removed = [pair for pair, mutation in latest.items() if not mutation.payload['state']]
+    if added:
+        _upsert(Favorite.__table__, added, ['user_id', 'location_id'])
+    if removed:
+        db.session.query(Favorite).filter(
+            tuple_(Favorite.user_id, Favorite.location_id).in_(removed)
+        ).delete(synchronize_session=False)
+    return set()
+
+
+def _apply_votes(mutations):
+    latest = _latest(mutations)
+    current = {
+        (user_id, location_id): is_valid
+        for user_id, location_id, is_valid in db.session.query(
+            DiscountVote.user_id, DiscountVote.location_id, DiscountVote.is_valid
+        ).filter(tuple_(DiscountVote.user_id, DiscountVote.location_id).in_(list(latest))).with_for_update()
+    }
+
+    # updated_at — время применения, а не отправки: по нему scoring.py находит новые голоса
+    now = datetime.utcnow()
+    deltas = {}
+    rows = []
+    for pair, mutation in latest.items():
+        is_valid = mutation.payload['is_valid']
+        previous = current.get(pair)
+        valid, invalid = deltas.get(pair[1], (0, 0))
+        valid += (1 if is_valid else 0) - (1 if previous is True else 0)
+        invalid += (0 if is_valid else 1) - (1 if previous is False else 0)
+        deltas[pair[1]] = (valid, invalid)
+        rows.append({'user_id': pair[0], 'location_id': pair[1], 'is_valid': is_valid, 'updated_at': now})
+
+    _upsert(DiscountVote.__table__, rows, ['user_id', 'location_id'], update=['is_valid', 'updated_at'])
+    for location_id, (valid, invalid) in deltas.items():
+        if valid or invalid:
+            db.session.query(Location).filter_by(id=location_id).update({
+                Location.valid_votes: Location.valid_votes + valid,
+                Location.invalid_votes: Location.invalid_votes + invalid,
+            }, synchronize_session=False)
+    return {location_id for location_id, delta in deltas.items() if any(delta)}
+
+
+def _apply_reviews(mutations):
+    # Повторно применённая очередь (например, после падения между коммитом
+    # и удалением из очереди) не должна удваивать отзывы
+    keys = {(m.user_id, m.location_id, m.created_at, m.payload['text']) for m in mutations}
+    existing = set(db.session.query(Review.user_id, Review.location_id, Review.created_at, Review.text).filter(
+        tuple_(Review.user_id, Review.location_id).in_(list({key[:2] for key in keys})),
+        Review.created_at.in_(list({key[2] for key in keys})),
+    ))
+
+    rows = []
+    totals = {}
+    for mutation in mutations:
+        key = (mutation.user_id, mutation.location_id, mutation.created_at, mutation.payload['text'])
+        if key in existing:
+            continue
+        existing.add(key)
+        rating = mutation.payload['rating']
+        rows.append({'user_id': mutation.user_id, 'location_id': mutation.location_id,
+                     'text': mutation.payload['text'], 'rating': rating, 'created_at': mutation.created_at})
+        count, rating_sum = totals.get(mutation.location_id, (0, 0))
+        totals[mutation.location_id] = (count + 1, rating_sum + rating)
+
+    if rows:
+        db.session.execute(Review.__table__.insert(), rows)
+    for location_id, (count, rating_sum) in totals.items():
+        db.session.query(Location).filter_by(id=location_id).update({
+            Location.reviews_count: Location.reviews_count + count,
+            Location.rating_sum: Location.rating_sum + rating_sum,
+        }, synchronize_session=False)
+    return set(totals)
+
+
+_APPLIERS = ((FAVORITE, _apply_favorites), (VOTE, _apply_votes), (REVIEW, _apply_reviews))
+
+
+# Применяет пачку в одной транзакции и возвращает id мест, которые изменились
+def apply_mutations(mutations):
+    location_ids = {mutation.location_id for mutation in mutations}
+    known = {location_id for (location_id,) in
+             db.session.query(Location.id).filter(Location.id.in_(list(location_ids)))}
+    mutations = [mutation for mutation in mutations if mutation.location_id in known]
+
+    touched = set()
+    try:
+        for kind, apply in _APPLIERS:
+            selected = [mutation for mutation in mutations if mutation.kind == kind]
+            if selected:
+                touched |= apply(selected)
+        stale = {mutation.location_id for mutation in mutations if mutation.kind in (REVIEW, FAVORITE)}
+        if stale:
+            _upsert(SimilarStale.__table__, [{'location_id': location_id} for location_id in stale], ['location_id'])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return touched
+
+
+# Ещё не применённые изменения пользователя: страницы накладывают их
+# на прочитанное из базы, чтобы пользователь сразу видел свои действия
+class PendingWrites:
+    def __init__(self, mutations=()):
+        self.favorites = {}
+        self.votes = {}
+        self.reviews = []
+        for mutation in mutations:
+            if mutation.kind == FAVORITE:
+                self.favorites[mutation.location_id] = mutation.payload['state']
+            elif mutation.kind == VOTE:
+                self.votes[mutation.location_id] = mutation.payload['is_valid']
+            elif mutation.kind == REVIEW:
+                self.reviews.append(mutation)
+
+    def __bool__(self):
+        return bool(self.favorites or self.votes or self.reviews)
+
+
+class WriteQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.path = None
+        self.batch_size = 500
+        self.flush_interval = 0.5
+        self._local = threading.local()
+        self._owner = f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+        self._worker = None
+        self._worker_pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = bool(app.config.get('WRITE_BEHIND'))
+        self.path = app.config.get('WRITE_QUEUE_PATH') or os.path.join(app.instance_path, 'write_queue.sqlite3')
+        self.batch_size = int(app.config.get('WRITE_BATCH_SIZE', 500))
+        self.flush_interval = float(app.config.get('WRITE_FLUSH_INTERVAL', 0.5))
+        app.extensions['write_queue'] = self
+        # Очередь могла остаться от прошлого запуска: разбирать её, не дожидаясь новой записи
+        if self.enabled:
+            self._ensure_worker()
+
+    # Соединение своё у каждого потока и не переживает fork
+    def _connection(self):
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def submit(self, kind, user_id, location_id, **payload):
+        created_at = datetime.utcnow().replace(microsecond=0)
+        if not self.enabled:
+            mutation = Mutation(None, kind, user_id, location_id, payload, created_at)
+            cache.evict_locations(apply_mutations([mutation]))
+            return
+        self._connection().execute(
+            'INSERT INTO mutations (kind, user_id, location_id, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+            (kind, user_id, location_id, json.dumps(payload, ensure_ascii=False), created_at.isoformat()),
+        )
+        self._ensure_worker()
+
+    @staticmethod
+    def _rows_to_mutations(rows):
+        return [
+            Mutation(row[0], row[1], row[2], row[3], json.loads(row[4]), datetime.fromisoformat(row[5]))
+            for row in rows
+        ]
+
+    def pending(self, user_id, location_id=None):
+        if not self.enabled:
+            return PendingWrites()
+        sql = 'SELECT id, kind, user_id, location_id, payload, created_at FROM mutations WHERE user_id = ?'
+        params = [user_id]
+        if location_id is not None:
+            sql += ' AND location_id = ?'
+            params.append(location_id)
+        return PendingWrites(self._rows_to_mutations(self._connection().execute(sql + ' ORDER BY id', params)))
+
+    def depth(self):
+        if not self.enabled:
+            return 0
+        return self._connection().execute('SELECT COUNT(*) FROM mutations').fetchone()[0]
+
+    def _acquire_lease(self):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM lease WHERE name = 'worker'").fetchone()
+            if row is not None and row[0] != self._owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO lease (name, owner, expires_at) VALUES ('worker', ?, ?)",
+                         (self._owner, now + LEASE_SECONDS))
+            return True
+        finally:
+            conn.execute('COMMIT')
+
+    def _release_lease(self):
+        self._connection().execute("DELETE FROM lease WHERE name = 'worker' AND owner = ?", (self._owner,))
+
+    def _apply_batch(self, mutations):
+        try:
+            return apply_mutations(mutations)
+        except DATA_ERRORS:
+            logger.exception('Пачка из %d изменений не применилась, применяю по одному', len(mutations))
+        touched = set()
+        for mutation in mutations:
+            try:
+                touched |= apply_mutations([mutation])
+            except DATA_ERRORS:
+                logger.exception('Изменение %s отброшено', mutation)
+        return touched
+
+    def _refresh_similar(self):
+        try:
+            cache.evict_locations(refresh_stale())
+        except Exception:
+            db.session.rollback()
+            logger.exception('Не удалось пересчитать похожие места')
+
+    # Разбирает очередь, пока она не опустеет; возвращает число применённых изменений
+    def drain(self):
+        if not self._acquire_lease():
+            return 0
+        conn = self._connection()
+        applied = 0
+        try:
+            while True:
+                rows = conn.execute(
+                    'SELECT id, kind, user_id, location_id, payload, created_at FROM mutations ORDER BY id LIMIT ?',
+                    (self.batch_size,),
+                ).fetchall()
+                if not rows:
+                    break
+                mutations = self._rows_to_mutations(rows)
+                touched = self._apply_batch(mutations)
+                conn.execute('DELETE FROM mutations WHERE id <= ?', (mutations[-1].id,))
+                cache.evict_locations(touched)
+                applied += len(mutations)
+                if not self._acquire_lease():
+                    break
+            if applied:
+                self._refresh_similar()
+        finally:
+            self._release_lease()
+        return applied
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with self.app.app_context():
+                    self.drain()
+            except Exception:
+                logger.exception('Ошибка фоновой записи')
+
+    # Поток запускается в init_app и проверяется при каждой записи: после fork в gunicorn его нужно поднять заново
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='write-queue', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._worker is not None and self._worker.is_alive():
+            self._worker.join(timeout=5)
+
+
+write_queue = WriteQueue()
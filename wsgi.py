@@ -0,0 +1,11 @@
+import os
+
+from app import create_app
+
+# Точка входа для WSGI-серверов: gunicorn -c gunicorn.conf.py wsgi:app.
+# Без SECRET_KEY сессии подписывались бы ключом по умолчанию из config.py,
+# который лежит в открытом репозитории, поэтому сервер не запускается.
+if not os.environ.get('SECRET_KEY'):
+    raise RuntimeError('Задайте SECRET_KEY в окружении перед запуском wsgi:app')
+
+app = create_app()